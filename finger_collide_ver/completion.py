@@ -0,0 +1,176 @@
+import os
+
+import numpy as np
+
+WORDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "words")
+CACHE_DIR = os.path.join(WORDS_DIR, "cache")
+
+# arrays a trie is saved as, one .npy file each
+# labels is written last, its file dates a complete cache
+TRIE_ARRAYS = ("first_child", "child_count", "top", "offsets", "blob", "labels")
+
+
+class WordTrie:
+    # prefix trie of a frequency ranked word list, kept in flat arrays so it
+    # can be memory-mapped instead of parsed at startup
+    # nodes are numbered breadth first, so the children of a node are
+    # contiguous and sorted by label:
+    #   labels[i]: code point of the letter leading to node i (root = 0)
+    #   first_child[i], child_count[i]: children of node i
+    #   top[i]: ids of the k most frequent words below node i, -1 padded
+    # word i is blob[offsets[i] : offsets[i + 1]] in utf-8
+    def __init__(self, arrays):
+        self.labels = arrays["labels"]
+        self.first_child = arrays["first_child"]
+        self.child_count = arrays["child_count"]
+        self.top = arrays["top"]
+        self.offsets = arrays["offsets"]
+        self.blob = arrays["blob"]
+        self.k = self.top.shape[1]
+
+    # build from words, most frequent first, keeping the top k words per node
+    @classmethod
+    def build(cls, words, k=3):
+        children = [{}]  # letter -> node, per node
+        top = [[]]
+        for word_id, word in enumerate(words):
+            node = 0
+            for letter in word:
+                child = children[node].get(letter)
+                if child is None:
+                    child = children[node][letter] = len(children)
+                    children.append({})
+                    top.append([])
+                node = child
+                # words come in rank order, so the first k are the top k
+                if len(top[node]) < k:
+                    top[node].append(word_id)
+            if len(top[0]) < k:
+                top[0].append(word_id)
+
+        # renumber breadth first with sorted children
+        order = [0]
+        labels = [0]
+        first_child = np.zeros(len(children), dtype=np.int32)
+        child_count = np.zeros(len(children), dtype=np.int32)
+        for new_id, node in enumerate(order):
+            first_child[new_id] = len(order)
+            child_count[new_id] = len(children[node])
+            for letter in sorted(children[node]):
+                order.append(children[node][letter])
+                labels.append(ord(letter))
+
+        top_ids = np.full((len(children), k), -1, dtype=np.int32)
+        for new_id, node in enumerate(order):
+            top_ids[new_id, : len(top[node])] = top[node]
+
+        encoded = [word.encode("utf-8") for word in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(word) for word in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        return cls(
+            {
+                "labels": np.array(labels, dtype=np.uint32),
+                "first_child": first_child,
+                "child_count": child_count,
+                "top": top_ids,
+                "offsets": offsets,
+                "blob": blob,
+            }
+        )
+
+    # save as one .npy file per array in directory
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in TRIE_ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    # memory-map a trie saved in directory, pages are read on first use
+    # kept as plain arrays over the mapping (indexing a np.memmap costs more)
+    @classmethod
+    def load(cls, directory):
+        return cls(
+            {
+                name: np.asarray(
+                    np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+                )
+                for name in TRIE_ARRAYS
+            }
+        )
+
+    # child of node through letter, -1 if there is none
+    def child(self, node, letter):
+        start = int(self.first_child[node])
+        labels = self.labels[start : start + int(self.child_count[node])]
+        id = int(np.searchsorted(labels, ord(letter)))
+        if id < len(labels) and labels[id] == ord(letter):
+            return start + id
+        return -1
+
+    def word(self, word_id):
+        start, end = self.offsets[word_id], self.offsets[word_id + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    # most frequent words starting with the prefix of node, best first
+    def suggestions(self, node):
+        return [self.word(word_id) for word_id in self.top[node] if word_id >= 0]
+
+
+# read a word list, one word per line (extra columns such as counts are
+# ignored), most frequent first, duplicates keep their best rank
+def read_words(path):
+    words = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if fields:
+                words.setdefault(fields[0].lower(), None)
+    return list(words)
+
+
+# trie of the word list at path, memory-mapped from CACHE_DIR
+# the cache is built on first use and again whenever the word list is newer
+def load_trie(path, k=3, cache_dir=CACHE_DIR):
+    name = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.join(cache_dir, f"{name}.top{k}.trie")
+    stamp = os.path.join(directory, "labels.npy")
+    if not os.path.exists(stamp) or os.path.getmtime(stamp) < os.path.getmtime(path):
+        WordTrie.build(read_words(path), k).save(directory)
+    return WordTrie.load(directory)
+
+
+class Completer:
+    # completions of the word being typed, followed letter by letter
+    # path[i] is the trie node of the first i letters of word (-1 once the
+    # word left the trie), so typing a letter descends one node, backspace
+    # drops the last one and any other edit keeps the common prefix
+    def __init__(self, trie):
+        self.trie = trie
+        self.word = ""
+        self.path = [0]
+        self.suggestions = trie.suggestions(0)
+
+    # follow the word before the cursor, returns the top k completions
+    # (the most frequent words when word is empty, none if nothing matches)
+    def update(self, word):
+        word = word.lower()
+        if word == self.word:
+            return self.suggestions
+
+        common = 0
+        for old, new in zip(self.word, word):
+            if old != new:
+                break
+            common += 1
+        del self.path[common + 1 :]
+
+        node = self.path[-1]
+        for letter in word[common:]:
+            if node != -1:
+                node = self.trie.child(node, letter)
+            self.path.append(node)
+
+        self.word = word
+        self.suggestions = self.trie.suggestions(node) if node != -1 else []
+        return self.suggestions
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class ContactEngine:
+    # contacts between every pair of fingertips, updated from their world
+    # coordinates with one distance matrix per frame
+    # a pair starts touching at distance <= enter and stops at distance > exit
+    # (exit > enter, so jitter around one threshold does not retrigger it)
+    # enter, exit: (n, n) thresholds in meters, pairs that never touch have a
+    # negative enter threshold
+    def __init__(self, enter, exit):
+        self.enter = np.asarray(enter, dtype=np.float32)
+        self.exit = np.asarray(exit, dtype=np.float32)
+
+        size = len(self.enter)
+        self.dist = np.zeros((size, size), dtype=np.float32)
+        self.touching = np.zeros((size, size), dtype=bool)
+        self.fired = np.zeros((size, size), dtype=bool)  # contact raised its event
+
+    # update contacts from tips (n, 3), present (n,) fingers on screen and
+    # gate (n, n) pairs whose contact may raise its event this frame (None = all)
+    # contacts follow distance alone, so a held contact outlasts a frame
+    # outside the gate; each contact raises its event once, on the first frame
+    # it is inside the gate, which need not be the frame it started
+    # returns (began, ended): (n, n) pairs whose contact raised its event /
+    # stopped
+    def update(self, tips, present, gate=None):
+        diff = tips[:, None, :] - tips[None, :, :]
+        self.dist = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+
+        touching = self.dist <= np.where(self.touching, self.exit, self.enter)
+        touching &= present[:, None]
+        touching &= present
+
+        began = touching & ~self.fired
+        if gate is not None:
+            began &= gate
+        ended = self.touching > touching
+        self.touching = touching
+        self.fired |= began
+        self.fired &= touching
+        return began, ended
+
+
+# (n, n) thresholds, value for the given pairs and -1 (never) elsewhere
+# each pair is kept once, as [a, b] with a < b, so it raises one event
+def pair_thresholds(size, pairs, value):
+    thresholds = np.full((size, size), -1, dtype=np.float32)
+    for a, b in pairs:
+        thresholds[min(a, b), max(a, b)] = value
+    return thresholds
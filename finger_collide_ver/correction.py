@@ -0,0 +1,269 @@
+import os
+import zlib
+
+import numpy as np
+
+from completion import CACHE_DIR, read_words
+
+# arrays an index is saved as, one .npy file each
+# keys is written last, its file dates a complete cache
+INDEX_ARRAYS = ("word_ids", "offsets", "blob", "keys")
+
+
+# every string left after deleting up to max_distance letters of word
+def deletes(word, max_distance):
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {
+            text[:id] + text[id + 1 :] for text in frontier for id in range(len(text))
+        }
+        found |= frontier
+    return found
+
+
+def delete_hash(text):
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class DeletionIndex:
+    # SymSpell deletion neighbourhood index of a word list: two words are at
+    # most max_distance edits apart only if deleting up to max_distance letters
+    # from each gives a common string, so a lookup hashes the deletes of the
+    # typed word instead of comparing it with every word
+    #   keys: sorted crc32 of the deletes of every word
+    #   word_ids[i]: word (rank in the list) keys[i] was deleted from
+    # word i is blob[offsets[i] : offsets[i + 1]] in utf-8
+    # hash collisions only add candidates, every candidate is checked
+    def __init__(self, arrays, max_distance):
+        self.keys = arrays["keys"]
+        self.word_ids = arrays["word_ids"]
+        self.offsets = arrays["offsets"]
+        self.blob = arrays["blob"]
+        self.max_distance = max_distance
+
+    # build from words, most frequent first
+    @classmethod
+    def build(cls, words, max_distance=2):
+        keys, word_ids = [], []
+        for word_id, word in enumerate(words):
+            for text in deletes(word, max_distance):
+                keys.append(delete_hash(text))
+                word_ids.append(word_id)
+        keys = np.array(keys, dtype=np.uint32)
+        order = np.argsort(keys, kind="stable")
+
+        encoded = [word.encode("utf-8") for word in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(word) for word in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        return cls(
+            {
+                "keys": keys[order],
+                "word_ids": np.array(word_ids, dtype=np.int32)[order],
+                "offsets": offsets,
+                "blob": blob,
+            },
+            max_distance,
+        )
+
+    # save as one .npy file per array in directory
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    # memory-map an index saved in directory, as plain arrays over the
+    # mapping (indexing a np.memmap costs more)
+    @classmethod
+    def load(cls, directory, max_distance):
+        return cls(
+            {
+                name: np.asarray(
+                    np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+                )
+                for name in INDEX_ARRAYS
+            },
+            max_distance,
+        )
+
+    def word(self, word_id):
+        start, end = self.offsets[word_id], self.offsets[word_id + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    # ids of the words sharing a delete string with texts, most frequent first
+    def lookup(self, texts):
+        hashes = np.array([delete_hash(text) for text in texts], dtype=np.uint32)
+        starts = np.searchsorted(self.keys, hashes, side="left")
+        ends = np.searchsorted(self.keys, hashes, side="right")
+        ranges = [self.word_ids[start:end] for start, end in zip(starts, ends)]
+        return np.unique(np.concatenate(ranges))
+
+    # ids of the words within max_distance edits of word, most frequent first
+    def candidates(self, word):
+        return self.lookup(deletes(word, self.max_distance))
+
+    def contains(self, word):
+        return any(self.word(id) == word for id in self.lookup([word]).tolist())
+
+    # utf-8 bytes of words ids as rows of a (n, longest) array, 0 padded,
+    # and the length of each
+    def word_bytes(self, ids):
+        starts = self.offsets[ids]
+        lengths = self.offsets[ids + 1] - starts
+        columns = np.arange(lengths.max() if len(ids) else 0)
+        inside = columns < lengths[:, None]
+        positions = np.where(inside, starts[:, None] + columns, 0)
+        return np.where(inside, self.blob[positions], 0), lengths
+
+
+# deletion index of the word list at path, memory-mapped from CACHE_DIR
+# the cache is built on first use and again whenever the word list is newer
+def load_index(path, max_distance=2, cache_dir=CACHE_DIR):
+    name = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.join(cache_dir, f"{name}.d{max_distance}.symspell")
+    stamp = os.path.join(directory, "keys.npy")
+    if not os.path.exists(stamp) or os.path.getmtime(stamp) < os.path.getmtime(path):
+        DeletionIndex.build(read_words(path), max_distance).save(directory)
+    return DeletionIndex.load(directory, max_distance)
+
+
+# (256, 256) substitution costs between the utf-8 bytes of lowercase letters:
+# cost for neighbouring letter keys of layout, far_cost for other letters, 0
+# for the same letter; keys are neighbours when their centers are at most
+# radius key steps apart: the keys left and right and the staggered keys above
+# and below
+# returns None if layout has no single byte letter keys
+def key_adjacency(layout, cost=1.0, far_cost=np.inf, radius=1.2):
+    step = layout.keysize + layout.key_border
+    centers = layout.key_rects + layout.key_sizes / 2
+    letters = [
+        (ord(key.lower()), center)
+        for key, center in zip(layout.key_names, centers)
+        if key.isalpha() and ord(key.lower()) < 128
+    ]
+    if not letters:
+        return None
+
+    costs = np.full((256, 256), far_cost, dtype=np.float32)
+    np.fill_diagonal(costs, 0)
+    for a, center_a in letters:
+        for b, center_b in letters:
+            if a != b and np.hypot(*(center_a - center_b)) <= radius * step:
+                costs[a, b] = cost
+    return costs
+
+
+# optimal string alignment distance (edits plus swaps of adjacent letters)
+# from source to every row of targets (see DeletionIndex.word_bytes), one
+# row of the distance table at a time for all targets
+# letters are utf-8 bytes (exact for ascii words), substitutions cost
+# costs[a, b] (see key_adjacency), inserting or deleting a letter indel_cost
+# and swapping two swap_cost, distances above max_cost are inf
+def weighted_distances(
+    source, targets, lengths, costs, max_cost, indel_cost=1.0, swap_cost=1.0
+):
+    count, width = targets.shape
+    columns = np.arange(width + 1, dtype=np.float32)
+    first = np.concatenate([[0], np.full(width, indel_cost).cumsum()])
+    before = None
+    previous = np.broadcast_to(first.astype(np.float32), (count, width + 1))
+    for i, a in enumerate(source):
+        # deletion and substitution, then insertion along the row: the
+        # cheapest of cost[k] + indel_cost * (j - k) over k <= j is a running
+        # minimum
+        row = np.empty((count, width + 1), dtype=np.float32)
+        row[:, 0] = (i + 1) * indel_cost
+        substitution = previous[:, :-1] + costs[a][targets]
+        row[:, 1:] = np.minimum(previous[:, 1:] + indel_cost, substitution)
+        if i > 0:
+            swap = (targets[:, :-1] == a) & (targets[:, 1:] == source[i - 1])
+            if swap.any():
+                swapped = np.where(swap, before[:, :-2] + swap_cost, np.inf)
+                np.minimum(row[:, 2:], swapped, out=row[:, 2:])
+        if np.isfinite(indel_cost):
+            steps = columns * indel_cost
+            row = np.minimum.accumulate(row - steps, axis=1) + steps
+        # later rows build on this one and (swapping) the one before
+        if row.min() > max_cost and previous.min() > max_cost:
+            return np.full(count, np.inf)
+        before, previous = previous, row
+
+    distances = previous[np.arange(count), lengths]
+    return np.where(distances <= max_cost, distances, np.inf)
+
+
+class Corrector:
+    # spelling correction of a finished word (see DeletionIndex)
+    # only the typos jitter at key boundaries makes are corrected: a letter of
+    # a neighbouring key of the current layout, or two letters swapped, each
+    # costing typo_cost; other substitutions, missing and extra letters are
+    # left alone, as they mostly come from real words the dictionary lacks
+    # an unknown word is replaced by the cheapest known word,
+    # unless another word is as cheap and not much rarer (ambiguous)
+    #   typos_per_letter: typos corrected per letter of the word, at least one
+    #     and at most the index max_distance
+    #   min_rank_ratio: a tie is kept only if the second word ranks at least
+    #     this many times lower (word frequencies fall about as 1 / rank)
+    #   min_length: shorter words are left alone (too many close words)
+    def __init__(
+        self,
+        index,
+        typo_cost=1.0,
+        typos_per_letter=0.3,
+        min_rank_ratio=4,
+        min_length=3,
+    ):
+        self.index = index
+        self.typo_cost = typo_cost
+        self.typos_per_letter = typos_per_letter
+        self.min_rank_ratio = min_rank_ratio
+        self.min_length = min_length
+        self.costs = np.full((256, 256), np.inf, dtype=np.float32)
+        np.fill_diagonal(self.costs, 0)
+
+    # take key adjacency from layout, layouts without letters keep the last
+    def set_layout(self, layout):
+        costs = key_adjacency(layout, self.typo_cost)
+        if costs is not None:
+            self.costs = costs
+
+    # correction of word (lowercase), None if it is known or nothing is close
+    def correct(self, word):
+        word = word.lower()
+        if len(word) < self.min_length or not word.isalpha():
+            return None
+        if self.index.contains(word):
+            return None
+
+        # only substitutions and swaps, so only words of the same length
+        source = word.encode("utf-8")
+        ids = self.index.candidates(word)
+        lengths = self.index.offsets[ids + 1] - self.index.offsets[ids]
+        ids = ids[lengths == len(source)]
+        if not len(ids):
+            return None
+
+        typos = int(len(word) * self.typos_per_letter)
+        typos = min(max(typos, 1), self.index.max_distance)
+        targets, lengths = self.index.word_bytes(ids)
+        distances = weighted_distances(
+            source,
+            targets,
+            lengths,
+            self.costs,
+            typos * self.typo_cost,
+            indel_cost=np.inf,
+            swap_cost=self.typo_cost,
+        )
+
+        # candidates come most frequent first (ids are ranks)
+        best = np.flatnonzero(distances == distances.min())
+        if np.isinf(distances[best[0]]):
+            return None
+        if len(best) > 1 and ids[best[1]] + 1 < self.min_rank_ratio * (
+            ids[best[0]] + 1
+        ):
+            return None
+        return self.index.word(ids[best[0]])
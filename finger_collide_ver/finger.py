@@ -1,35 +1,52 @@
 import numpy as np
+from collections import namedtuple
+
+# immutable copy of finger state, safe to read from the render thread
+FingerState = namedtuple(
+    "FingerState",
+    ["name", "handedness", "on_key", "on_screen", "tip_wcoor", "tip_ncoor"],
+)
 
 
 class Finger:
-    def __init__(self, name, name_id, handedness):
+    # view of one row of the finger state arrays kept by Hands
+    # state is updated for all 10 fingers at once in Hands.update_finger
+    def __init__(self, hands, finger_id, name, name_id, handedness):
+        self.hands = hands
+        self.finger_id = finger_id      # 0-9, row in the state arrays
+
         # identify finger
         self.name = name                # THUMB/INDEX/MIDDLE/RING/PINKY
         self.name_id = name_id          # 0-4
         self.handedness = handedness    # Left or Right
 
-        # finger state
-        self.on_key = -1                # which key finger is on                
-        self.on_screen = False          # present on screen?
-        
-        # position related
-        self.tip_wcoor = [0, 0, 0]           # current tip position (world coor)
-        self.tip_ncoor = [0, 0, 0]           # current tip pos (normalized coor)
-    
-    # update finger present on screen
-    def update_present(self, wlandmark, nlandmark, keyboard):
-        # update fingertip coordinates
-        self.tip_wcoor = [wlandmark.x, wlandmark.y, wlandmark.z * 100]
-        self.tip_ncoor = [nlandmark.x, nlandmark.y, nlandmark.z]
-        
-        # query currently lies on which key
-        self.on_key = keyboard.query_key_id(self.tip_ncoor[0], self.tip_ncoor[1])
-        self.on_screen = True
-
-    # update finger out of screen
-    def update_absent(self):
-        self.tip_wcoor = [0, 0, 0]
-        self.tip_ncoor = [0, 0, 0]
-        
-        self.on_screen = False
-        self.on_key = -1
\ No newline at end of file
+    # which key finger is on, -1 if none
+    @property
+    def on_key(self):
+        return self.hands.key_name(self.hands.on_key[self.finger_id])
+
+    # present on screen?
+    @property
+    def on_screen(self):
+        return bool(self.hands.on_screen[self.finger_id])
+
+    # current tip position (world coor)
+    @property
+    def tip_wcoor(self):
+        return self.hands.tip_wcoor[self.finger_id]
+
+    # current tip pos (normalized coor)
+    @property
+    def tip_ncoor(self):
+        return self.hands.tip_ncoor[self.finger_id]
+
+    # copy of current state for rendering
+    def state(self):
+        return FingerState(
+            self.name,
+            self.handedness,
+            self.on_key,
+            self.on_screen,
+            tuple(self.tip_wcoor.tolist()),
+            tuple(self.tip_ncoor.tolist()),
+        )
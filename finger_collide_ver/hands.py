@@ -1,32 +1,91 @@
 import cv2
+import time
 import numpy as np
-from mediapipe.framework.formats import landmark_pb2
-from mediapipe import solutions
 
-from typing import Mapping, Tuple
-from mediapipe.python.solutions.drawing_utils import DrawingSpec
-from mediapipe.python.solutions import hands_connections
+from collections import namedtuple
 
+from contacts import ContactEngine, pair_thresholds
+from events import KeyEvent
 from finger import Finger
+from hud import Hud, TextFont
+from landmarks import HANDEDNESS_NAMES, empty_hands
 
 BLUE = (249, 209, 101)
 WHITE = (255, 255, 255)
+LIGHT_GRAY = (224, 224, 224)
+
+NUM_FINGERS = 10
+FINGERS_PER_HAND = 5
+TIP_LANDMARK_IDS = [4, 8, 12, 16, 20]  # thumb to pinky
+# finger rows of the state arrays grouped per hand, indexed by handedness
+HAND_SHAPE = (len(HANDEDNESS_NAMES), FINGERS_PER_HAND)
+
+# fingertip pairs of a hand (thumb = 0 to pinky = 4) that type when pinched
+# None types the key under both fingertips, a string is typed as it is
+PINCH_KEYS = {
+    (0, 1): None,  # thumb + index
+    (0, 2): " ",  # thumb + middle
+    (0, 3): "←",  # thumb + ring
+    (0, 4): "↶",  # thumb + little, undo
+}
+
+# landmark pairs joined in the hand skeleton, same as mediapipe HAND_CONNECTIONS
+HAND_CONNECTIONS = np.array(
+    [
+        (0, 1), (1, 2), (2, 3), (3, 4),  # thumb
+        (0, 5), (5, 6), (6, 7), (7, 8),  # index
+        (5, 9), (9, 10), (10, 11), (11, 12),  # middle
+        (9, 13), (13, 14), (14, 15), (15, 16),  # ring
+        (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),  # pinky
+    ],
+    dtype=np.intp,
+)
+
+# immutable copy of hand state, safe to read from the render thread
+# detection arrays are never mutated after conversion, so they are shared
+HandsSnapshot = namedtuple(
+    "HandsSnapshot",
+    [
+        "detection",
+        "fingers",
+        "left_dist",
+        "right_dist",
+        "left_touch",
+        "right_touch",
+    ],
+)
 
 
 class Hands:
     def __init__(self):
-        # detection results
-        self.handedness_list = None
-        self.hand_landmarks_list = None
-        self.world_landmarks_list = None
-
-        # finger objects
+        # detection results (landmarks.HandArrays)
+        self.detection = empty_hands()
+
+        # finger state, one row per finger (left thumb to right pinky)
+        self.tip_wcoor = np.zeros((NUM_FINGERS, 3), dtype=np.float32)  # world coor
+        self.tip_ncoor = np.zeros((NUM_FINGERS, 3), dtype=np.float32)  # normalized
+        self.on_key = np.full(NUM_FINGERS, -1, dtype=np.int32)  # index in key_names
+        self.on_screen = np.zeros(NUM_FINGERS, dtype=bool)
+        self.keydown = np.zeros(NUM_FINGERS, dtype=bool)
+        self.key_names = []  # key names of the layout on_key refers to
+        self.layout = None  # layout on_key refers to
+        self.keystrokes = 0  # keys typed so far
+        # events.KeyEventBus typed keys are published to, None types them
+        # straight into the keyboard on the landmarker thread
+        self.key_events = None
+
+        # finger objects, views of the arrays above
         self.fingers = []
         self.init_fingers()
         
-        # check if index and thumb collides
+        # fingertip contacts in world space (meters), a pinch starts below
+        # TOUCH_THRESHOLD and ends above RELEASE_THRESHOLD
+        # world coordinates are relative to each hand, so only pairs within
+        # a hand are compared
         self.TOUCH_THRESHOLD = 0.015
-        
+        self.RELEASE_THRESHOLD = 0.02
+        self.init_pinches()
+
         self.left_dist = 0
         self.right_dist = 0
         
@@ -46,6 +105,19 @@ class Hands:
             "FONT_THICKNESS": 1,
             "TEXT_COLOR": BLUE,
         }
+
+        self.skeleton_format = {
+            "LANDMARK_RADIUS": 5,
+            "LANDMARK_COLOR": BLUE,
+            "BORDER_RADIUS": 6,
+            "BORDER_COLOR": LIGHT_GRAY,
+            "CONNECTION_THICKNESS": 2,
+            "CONNECTION_COLOR": WHITE,
+        }
+
+        # cached text for the debug overlays (draw_fingertips, draw_finger)
+        # set hud.enabled = False to skip them entirely
+        self.hud = Hud()
     
     # create the 10 finger objects
     def init_fingers(self):
@@ -53,242 +125,307 @@ class Hands:
         hands = ["Left", "Right"]
         for hand in hands:
             for finger_id, finger_name in enumerate(finger_names):
-                finger = Finger(finger_name, finger_id, hand)
+                finger = Finger(
+                    self, len(self.fingers), finger_name, finger_id, hand
+                )
                 self.fingers.append(finger)
+
+    # contact engine and key typed by each pinch of PINCH_KEYS, on both hands
+    def init_pinches(self):
+        # pinch_keys[a, b]: key typed when fingers a < b touch
+        # key_pinch[a, b]: the key under the fingertips is typed instead
+        self.pinch_keys = np.full((NUM_FINGERS, NUM_FINGERS), "", dtype=object)
+        self.key_pinch = np.zeros((NUM_FINGERS, NUM_FINGERS), dtype=bool)
+        pinches = []
+        for hand in range(len(HANDEDNESS_NAMES)):
+            for (a, b), key in PINCH_KEYS.items():
+                pair = (hand * FINGERS_PER_HAND + a, hand * FINGERS_PER_HAND + b)
+                pinches.append(pair)
+                if key is None:
+                    self.key_pinch[pair] = True
+                else:
+                    self.pinch_keys[pair] = key
+
+        self.contacts = ContactEngine(
+            pair_thresholds(NUM_FINGERS, pinches, self.TOUCH_THRESHOLD),
+            pair_thresholds(NUM_FINGERS, pinches, self.RELEASE_THRESHOLD),
+        )
+
+    # name of key at index of key_names, -1 if none
+    def key_name(self, key_id):
+        return self.key_names[key_id] if key_id != -1 else -1
         
     # interpret and store hand landmark detection result
+    # detection is a result converted by landmarks.result_arrays, None if no hand
     # may add more processing here
-    def process_results(self, detection_result, timestamp, keyboard):
+    def process_results(self, detection, timestamp, keyboard):
         # no hand present
-        if detection_result == None:
-            self.hand_landmarks_list = None
-            self.world_landmarks_list = None
-            self.handedness_list = None
-        else:
-            self.hand_landmarks_list = detection_result.hand_landmarks
-            self.world_landmarks_list = detection_result.hand_world_landmarks
-            self.handedness_list = detection_result.handedness
+        if detection is None:
+            detection = empty_hands()
+        self.detection = detection
         
         # update finger
         self.update_finger(keyboard)
         
         # check for key typed
-        typed = self.detect_type()
-        if typed != "":
-            for letter in typed:
-                keyboard.type_key(letter)
+        for key, finger_id in self.detect_type():
+            self.type_key(key, finger_id, timestamp, keyboard)
+
+        # keys under fingertips are hovered, keys pinched on are pressed
+        pressed = self.on_key[[0, 5]][[self.left_touch, self.right_touch]]
+        keyboard.set_key_states(self.layout, self.on_key, pressed)
+
+    # hand a typed key to the key event bus (events.KeyEventBus)
+    def type_key(self, key, finger_id, timestamp, keyboard):
+        self.keystrokes += 1
+        if self.key_events is None:
+            keyboard.type_key(key)
+            return
+
+        finger = self.fingers[finger_id]
+        hand = finger_id // FINGERS_PER_HAND
+        scores = self.detection.handedness_score[self.detection.handedness == hand]
+        confidence = float(scores[0]) if len(scores) else 0.0
+        self.key_events.publish(
+            KeyEvent(
+                key,
+                int(finger_id),
+                finger.handedness,
+                confidence,
+                timestamp,
+                time.perf_counter(),
+            )
+        )
 
+    # update all fingers in one pass over the state arrays
     def update_finger(self, keyboard):
-        index_displacement = {"Left": 0, "Right": 5}
-        
-        # to identify which fingers absent
-        on_screen_fingers = []
-        
-        # for each hand on screen
-        for hand_id, handedness in enumerate(self.handedness_list):
-            start_id = index_displacement[handedness[0].category_name]
-
-            # for each finger in hand
-            for idx in range(0, 5):
-                finger = start_id + idx
-                
-                # retrieve landmark
-                landmark_id = 4 * (idx + 1)
-                wlandmark = self.world_landmarks_list[hand_id][landmark_id]
-                nlandmark = self.hand_landmarks_list[hand_id][landmark_id]
-
-                self.fingers[finger].update_present(wlandmark, nlandmark, keyboard)
-                
-                on_screen_fingers.append(finger)
-                
-        # update for all absent fingers     
-        for finger_id in range(10):
-            if finger_id not in on_screen_fingers:
-                self.fingers[finger_id].update_absent()
-
-    def calc_dist(self, a, b):
-        D = ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
-        return D
-        
+        # absent fingers are reset
+        self.tip_wcoor.fill(0)
+        self.tip_ncoor.fill(0)
+        self.on_screen.fill(False)
+
+        # gather fingertips of each hand on screen
+        detection = self.detection
+        hands = detection.handedness
+        wtips = detection.world_landmarks[:, TIP_LANDMARK_IDS]
+        ntips = detection.landmarks[:, TIP_LANDMARK_IDS]
+        self.tip_wcoor.reshape(HAND_SHAPE + (3,))[hands] = wtips
+        self.tip_ncoor.reshape(HAND_SHAPE + (3,))[hands] = ntips
+        self.on_screen.reshape(HAND_SHAPE)[hands] = True
+
+        # query which keys the tips lie on, absent fingers are on no key
+        layout = self.layout = keyboard.layout
+        self.on_key[:] = keyboard.query_key_ids(self.tip_ncoor[:, :2], layout)
+        self.on_key[~self.on_screen] = -1
+        self.key_names = layout.key_names
+
     # detect if key is pressed
+    # returns (key, finger id) of the keys typed this frame, finger id of the
+    # finger pinched against the thumb
     def detect_type(self):
-        self.left_dist = self.calc_dist(self.fingers[0].tip_wcoor, self.fingers[1].tip_wcoor)
-        self.right_dist = self.calc_dist(self.fingers[5].tip_wcoor, self.fingers[6].tip_wcoor)
-        
-        typed = ""
-        if self.left_dist <= self.TOUCH_THRESHOLD \
-            and self.fingers[0].on_key == self.fingers[1].on_key \
-                and self.fingers[0].on_key != -1:
-                    if not self.left_touch:
-                        # print(f"type key {self.fingers[0].on_key}")
-                        typed += self.fingers[0].on_key
-                    self.left_touch = True
-        else:
-            self.left_touch = False
-                    
-        if self.right_dist <= self.TOUCH_THRESHOLD \
-            and self.fingers[5].on_key == self.fingers[6].on_key \
-                and self.fingers[5].on_key != -1:
-                    if not self.right_touch:
-                        # print(f"type key {self.fingers[5].on_key}")
-                        typed += self.fingers[5].on_key
-                        
-                    self.right_touch = True
-        else:
-            self.right_touch = False
+        # pinches typing the key under the fingertips type once both are on
+        # the same key, a held pinch lasts while the tips cross key edges
+        on_key = self.on_key
+        same_key = (on_key[:, None] == on_key[None, :]) & (on_key != -1)[:, None]
+        began, _ = self.contacts.update(
+            self.tip_wcoor, self.on_screen, same_key | ~self.key_pinch
+        )
+
+        # thumb and index of each hand, for drawing and key states
+        dist = self.contacts.dist
+        touching = self.contacts.touching
+        self.left_dist = float(dist[0, 1])
+        self.right_dist = float(dist[5, 6])
+        self.left_touch = bool(touching[0, 1])
+        self.right_touch = bool(touching[5, 6])
+
+        # type on the frame a pinch starts, left hand first
+        typed = []
+        if not began.any():
+            return typed
+        for a, b in np.argwhere(began):
+            if self.key_pinch[a, b]:
+                # print(f"type key {self.key_name(on_key[a])}")
+                typed.append((self.key_name(on_key[a]), b))
+            else:
+                typed.append((self.pinch_keys[a, b], b))
 
         return typed
 
+    # capture current state for rendering
+    def snapshot(self):
+        return HandsSnapshot(
+            self.detection,
+            tuple(finger.state() for finger in self.fingers),
+            self.left_dist,
+            self.right_dist,
+            self.left_touch,
+            self.right_touch,
+        )
+
     ######## DRAWING UTILITIES #########
-    def draw_text(self, img, text, text_x, text_y):
-        cv2.putText(
-            img,
-            text,
-            (text_x, text_y),
+    # font described by landmark_text_format
+    def landmark_font(self):
+        return TextFont(
             cv2.FONT_HERSHEY_DUPLEX,
             self.landmark_text_format["FONT_SIZE"],
-            self.landmark_text_format["TEXT_COLOR"],
             self.landmark_text_format["FONT_THICKNESS"],
             cv2.LINE_AA,
         )
-        
-        
-    def draw_fingertips(self, img):
-        annotated_img = np.copy(img)
+
+    # draw lines one below the other, first baseline starting at (text_x, text_y)
+    def draw_landmark_text(self, img, text_x, text_y, lines):
+        return self.hud.text(
+            img,
+            (text_x, text_y),
+            lines,
+            self.landmark_font(),
+            self.landmark_text_format["TEXT_COLOR"],
+        )
+
+    def draw_fingertips(self, img, state=None):
+        if not self.hud.enabled:
+            return img
+        if state is None:
+            state = self.snapshot()
+
+        annotated_img = img  # annotated in place
 
         text_start_pos = {"Left": 20, "Right": 400}
-        finger_displacement = {"Left": 0, "Right": 5}
+        detection = state.detection
 
-        for hand_id, hand in enumerate(self.handedness_list):
-            text_x = text_start_pos[hand[0].category_name]
+        for hand_id, hand in enumerate(detection.handedness):
+            hand_name = HANDEDNESS_NAMES[hand]
+            text_x = text_start_pos[hand_name]
             text_y = 40
 
-            for finger in range(5):
-                finger_id = finger + finger_displacement[hand[0].category_name]
-                landmark_id = 4 * (finger + 1)
-                landmark = self.world_landmarks_list[hand_id][landmark_id]
-                # landmark = self.hand_landmarks_list[hand_id][landmark_id]
+            # tips of this hand, as percentages
+            tips = detection.world_landmarks[hand_id, TIP_LANDMARK_IDS] * 100
+
+            lines = []
+            for finger, (x, y, z) in enumerate(tips.tolist()):
+                finger_id = finger + hand * FINGERS_PER_HAND
+                text = f"{finger+1} ({state.fingers[finger_id].on_key}): x {x:.1f}; y {y:.1f}; z {z:.1f}"
+                lines.append(text)
 
-                x, y, z = landmark.x, landmark.y, landmark.z
-                text = f"{finger+1} ({self.fingers[finger_id].on_key}): x {x*100:.1f}; y {y*100:.1f}; z {z*100:.1f}"
+            dist = state.left_dist if hand_name == "Left" else state.right_dist
+            lines.append(str(dist))
 
-                self.draw_text(annotated_img, text, text_x, text_y)
-                text_y += 15
-                
-            text = self.left_dist if hand[0].category_name == "Left" else self.right_dist
-            text = str(text)
-            self.draw_text(annotated_img, text, text_x, text_y)
+            self.draw_landmark_text(annotated_img, text_x, text_y, lines)
 
         return annotated_img
 
     # show coordinates of specified landmarks
-    def draw_finger(self, img):
-        annotated_img = np.copy(img)
+    def draw_finger(self, img, state=None):
+        if not self.hud.enabled:
+            return img
+        if state is None:
+            state = self.snapshot()
+
+        annotated_img = img  # annotated in place
 
         # extract which hand is right hand
-        hand_id = -1
-        for id, hand in enumerate(self.handedness_list):
-            if hand[0].category_name == "Right":
-                hand_id = id
+        detection = state.detection
+        right_hands = np.flatnonzero(
+            detection.handedness == HANDEDNESS_NAMES.index("Right")
+        )
 
-        if hand_id == -1:
+        if len(right_hands) == 0:
             return annotated_img
+        hand_id = right_hands[-1]
 
         # right hand index finger
         landmark_id_list = [5, 6, 7, 8]
         landmark_names = ["MCP", "DIP", "PIP", "TIP"]
         local_text_x, text_y = 20, 40
         world_text_x = 400
-        for idx, landmark_id in enumerate(landmark_id_list):
-            # parse landmark coordinates
-            landmark = self.hand_landmarks_list[hand_id][landmark_id]
-            x, y, z = landmark.x, landmark.y, landmark.z
-            text = f"{landmark_names[idx]}: x {x*100:.1f}; y {y*100:.1f}; z {z*100:.1f}"
 
-            cv2.putText(
-                annotated_img,
-                text,
-                (local_text_x, text_y),
-                cv2.FONT_HERSHEY_DUPLEX,
-                self.landmark_text_format["FONT_SIZE"],
-                self.landmark_text_format["TEXT_COLOR"],
-                self.landmark_text_format["FONT_THICKNESS"],
-                cv2.LINE_AA,
-            )
+        # parse landmark coordinates, as percentages
+        local = detection.landmarks[hand_id, landmark_id_list] * 100
+        world = detection.world_landmarks[hand_id, landmark_id_list] * 100
+        local_lines, world_lines = [], []
+        for idx in range(len(landmark_id_list)):
+            x, y, z = local[idx].tolist()
+            text = f"{landmark_names[idx]}: x {x:.1f}; y {y:.1f}; z {z:.1f}"
+            local_lines.append(text)
 
-            landmark = self.world_landmarks_list[hand_id][landmark_id]
-            x, y, z = landmark.x, landmark.y, landmark.z
-            text = f"{landmark_names[idx]}: x {x*100:.1f}; y {y*100:.1f}; z {z*100:.1f}"
-            cv2.putText(
-                annotated_img,
-                text,
-                (world_text_x, text_y),
-                cv2.FONT_HERSHEY_DUPLEX,
-                self.landmark_text_format["FONT_SIZE"],
-                self.landmark_text_format["TEXT_COLOR"],
-                self.landmark_text_format["FONT_THICKNESS"],
-                cv2.LINE_AA,
-            )
+            x, y, z = world[idx].tolist()
+            text = f"{landmark_names[idx]}: x {x:.1f}; y {y:.1f}; z {z:.1f}"
+            world_lines.append(text)
 
-            text_y += 15
+        self.draw_landmark_text(annotated_img, local_text_x, text_y, local_lines)
+        self.draw_landmark_text(annotated_img, world_text_x, text_y, world_lines)
 
         return annotated_img
 
-    def simple_hand_landmark_style(self) -> Mapping[Tuple[int, int], DrawingSpec]:
-        hand_landmark_style = {}
-        spec = DrawingSpec(color=BLUE, thickness=-1, circle_radius=5)
-
-        for landmark_id in range(21):
-            hand_landmark_style[landmark_id] = spec
+    # draw the skeleton of one hand from its (21, 3) normalized landmarks
+    # all connections go in one polylines call, and all circles of a color in
+    # another: a zero length segment of thickness 2r is a filled circle of radius r
+    def draw_skeleton(self, img, landmarks):
+        height, width = img.shape[:2]
+
+        # landmarks outside the frame are not drawn, nor their connections
+        xy = landmarks[:, :2]
+        visible = ((xy >= 0) & (xy <= 1)).all(axis=1)
+        if not visible.any():
+            return img
+        points = np.minimum(np.floor(xy * (width, height)), (width - 1, height - 1))
+        points = points.astype(np.int32)
+
+        connections = HAND_CONNECTIONS[visible[HAND_CONNECTIONS].all(axis=1)]
+        if len(connections):
+            cv2.polylines(
+                img,
+                points[connections],
+                False,
+                self.skeleton_format["CONNECTION_COLOR"],
+                self.skeleton_format["CONNECTION_THICKNESS"],
+            )
 
-        return hand_landmark_style
+        dots = np.repeat(points[visible, None], 2, axis=1)
+        cv2.polylines(
+            img,
+            dots,
+            False,
+            self.skeleton_format["BORDER_COLOR"],
+            2 * self.skeleton_format["BORDER_RADIUS"],
+        )
+        cv2.polylines(
+            img,
+            dots,
+            False,
+            self.skeleton_format["LANDMARK_COLOR"],
+            2 * self.skeleton_format["LANDMARK_RADIUS"],
+        )
 
-    def simple_hand_connection_style(self) -> Mapping[Tuple[int, int], DrawingSpec]:
-        hand_connection_style = {}
-        spec = DrawingSpec(color=WHITE, thickness=2)
+        return img
 
-        for conn in hands_connections.HAND_CONNECTIONS:
-            hand_connection_style[conn] = spec
+    def draw_landmarks_on_image(self, rgb_image, state=None):
+        if state is None:
+            state = self.snapshot()
 
-        return hand_connection_style
+        annotated_image = rgb_image  # annotated in place
 
-    def draw_landmarks_on_image(self, rgb_image):
-        annotated_image = np.copy(rgb_image)
+        detection = state.detection
 
         # Loop through the detected hands to visualize.
-        for idx in range(len(self.hand_landmarks_list)):
-            hand_landmarks = self.hand_landmarks_list[idx]
-            handedness = self.handedness_list[idx]
+        for idx in range(len(detection.handedness)):
+            hand_landmarks = detection.landmarks[idx]
+            handedness = HANDEDNESS_NAMES[detection.handedness[idx]]
 
             # Draw the hand landmarks.
-            hand_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-            hand_landmarks_proto.landmark.extend(
-                [
-                    landmark_pb2.NormalizedLandmark(
-                        x=landmark.x, y=landmark.y, z=landmark.z
-                    )
-                    for landmark in hand_landmarks
-                ]
-            )
-            solutions.drawing_utils.draw_landmarks(
-                annotated_image,
-                hand_landmarks_proto,
-                solutions.hands.HAND_CONNECTIONS,
-                self.simple_hand_landmark_style(),
-                self.simple_hand_connection_style(),
-            )
+            self.draw_skeleton(annotated_image, hand_landmarks)
 
             # Get the top left corner of the detected hand's bounding box.
             height, width, _ = annotated_image.shape
-            x_coordinates = [landmark.x for landmark in hand_landmarks]
-            y_coordinates = [landmark.y for landmark in hand_landmarks]
-            text_x = int(min(x_coordinates) * width)
-            text_y = int(min(y_coordinates) * height) - self.LR_text_format["MARGIN"]
+            min_x, min_y = hand_landmarks[:, :2].min(axis=0)
+            text_x = int(min_x * width)
+            text_y = int(min_y * height) - self.LR_text_format["MARGIN"]
 
             # Draw handedness (left or right hand) on the image.
             cv2.putText(
                 annotated_image,
-                f"{handedness[0].category_name}",
+                handedness,
                 (text_x, text_y),
                 cv2.FONT_HERSHEY_DUPLEX,
                 self.LR_text_format["FONT_SIZE"],
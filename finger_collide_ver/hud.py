@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+from collections import OrderedDict, namedtuple
+
+# how text is rasterized
+TextFont = namedtuple("TextFont", ["face", "scale", "thickness", "line_type"])
+
+
+# pre-render one line of text for blend_text
+# returns the offset of its top left corner from the text origin (start of the
+# baseline), alpha = weight of the frame pixel (0-255) and base = weighted color
+def rasterize(text, font, color):
+    (width, height), baseline = cv2.getTextSize(
+        text, font.face, font.scale, font.thickness
+    )
+    pad = font.thickness + 2  # antialiased strokes spill out of the text size
+    shape = (height + baseline + 2 * pad, width + 2 * pad)
+    coverage = np.zeros(shape, dtype=np.uint8)
+    cv2.putText(
+        coverage,
+        text,
+        (pad, pad + height),
+        font.face,
+        font.scale,
+        255,
+        font.thickness,
+        font.line_type,
+    )
+
+    alpha = cv2.merge([cv2.bitwise_not(coverage)] * 3)
+    base = cv2.merge([cv2.convertScaleAbs(coverage, alpha=c / 255) for c in color])
+    return (-pad, -pad - height), alpha, base
+
+
+# blend a rasterized line onto img in place, only over its own rectangle
+# out = img * alpha / 255 + base (as Keyboard.blend_overlay)
+def blend_text(img, origin, raster):
+    (dx, dy), alpha, base = raster
+    left, top = origin[0] + dx, origin[1] + dy
+
+    # clip to the frame
+    img_h, img_w = img.shape[:2]
+    height, width = alpha.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + width, img_w), min(top + height, img_h)
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    # roi is a view into img, so cv2 writes the result straight into the frame
+    roi = img[y0:y1, x0:x1]
+    crop = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+    cv2.multiply(roi, alpha[crop], dst=roi, scale=1 / 255)
+    cv2.add(roi, base[crop], dst=roi)
+
+
+class TextCache:
+    # rasterized lines of text keyed by (text, font, color)
+    # a line is rasterized the second time it is asked for: text seen only once
+    # (e.g. a value changing every frame) is not worth more than a putText
+    # least recently used lines are dropped once maxsize is reached
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.rasters = OrderedDict()
+        self.seen = OrderedDict()
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    # cached raster, None if the text should be drawn directly this time
+    def get(self, text, font, color):
+        key = (text, font, color)
+        raster = self.rasters.get(key)
+        if raster is not None:
+            self.rasters.move_to_end(key)
+            self.hits += 1
+            return raster
+
+        self.misses += 1
+        if key not in self.seen:
+            self.remember(self.seen, key, True)
+            return None
+
+        del self.seen[key]
+        raster = rasterize(text, font, color)
+        self.remember(self.rasters, key, raster)
+        return raster
+
+    def remember(self, entries, key, value):
+        entries[key] = value
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self.rasters), "hits": self.hits, "misses": self.misses}
+
+
+class Hud:
+    # text overlays drawn through a shared text cache
+    # repeated lines are blended from their cached raster, new ones use putText
+    # enabled = False turns text() into a no-op, callers should check it
+    # before formatting their text so disabled overlays cost nothing
+    def __init__(self, enabled=True, cache_size=512):
+        self.enabled = enabled
+        self.cache = TextCache(cache_size)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+
+    # draw lines one below the other onto img in place
+    # origin is the start of the first baseline
+    def text(self, img, origin, lines, font, color, line_height=15):
+        if not self.enabled:
+            return img
+
+        x, y = origin
+        for line in lines:
+            raster = self.cache.get(line, font, color)
+            if raster is not None:
+                blend_text(img, (x, y), raster)
+            else:
+                cv2.putText(
+                    img,
+                    line,
+                    (x, y),
+                    font.face,
+                    font.scale,
+                    color,
+                    font.thickness,
+                    font.line_type,
+                )
+            y += line_height
+
+        return img
+
+    def stats(self):
+        return self.cache.stats()
@@ -1,65 +1,273 @@
 import cv2
+import os
+import threading
 import numpy as np
+from collections import namedtuple
+
+from completion import WORDS_DIR, Completer, load_trie
+from correction import Corrector, load_index
+from hud import Hud, TextFont
+from layout import REFERENCE_FRAME_SIZE, KeyboardLayout, load_layouts
+from text_buffer import GapBuffer, TextView
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
+GRAY = (110, 110, 110)
+BLUE = (249, 209, 101)
+
+# visual state of a key
+KEY_IDLE = 0
+KEY_HOVER = 1  # a fingertip is on the key
+KEY_PRESSED = 2
+
+# keys of a layout showing word completions, best first
+# typing one replaces the word before the cursor with its completion
+SUGGESTION_KEYS = "①②③"
+
+# immutable copy of keyboard state, safe to read from the render thread
+# text_lines: rows of typed text shown, the last one holds the cursor
+# suggestions: completions shown on SUGGESTION_KEYS
+KeyboardSnapshot = namedtuple(
+    "KeyboardSnapshot", ["layout", "key_states", "text_lines", "suggestions"]
+)
+
+
+# replacement of word in its case: keys type capitals, so replacements are
+# too unless word has lowercase letters
+def match_case(word, replacement):
+    return replacement.upper() if word == word.upper() else replacement
 
 
 class Keyboard:
     def __init__(self):
-        # top left corner
-        self.keyboard_pos = (200, 300)
+        # key geometry, see layout.py
+        # all layout pages are computed once and switched by name at runtime
+        # layouts are specified for REFERENCE_FRAME_SIZE and rescaled to the
+        # actual camera frame size (see set_frame_size)
+        self.base_layouts = load_layouts(origin=(200, 300), keysize=80, key_border=8)
+        self.layouts = dict(self.base_layouts)
+        self.layout = None
+
+        self.frame_size = REFERENCE_FRAME_SIZE
 
-        # key size
-        self.keysize = 80
-        self.key_border = 8
-        
         self.keycolor = BLACK
         self.key_opacity = 0.6
         self.key_type_opacity = 0.8
+        self.hovercolor = GRAY
+        self.presscolor = BLUE
 
         self.text_pos = (30, 50)
         self.fontcolor = WHITE
         self.fonttype = cv2.FONT_HERSHEY_DUPLEX
         self.fontscale = 1
 
-        # letters
-        self.letters = [list("QWERTYUIOP"), list("ASDFGHJKL"), list("ZXCVBNM←")]                
-        self.letter_pos = {}
+        # cached overlay (pre-rendered keys, blended in one pass per frame)
+        # overlay_cache_key() -> (origin, alpha, base, buffer, variants, tile_states)
+        # alpha = weight of frame pixel (0-255), base = pre-weighted key and glyph color
+        # variants = (alpha, base) of all keys in each KEY_* state, tiles of keys
+        # whose state changed are copied from them into alpha and base
+        self.use_overlay_cache = True
+        self.overlays = {}
+
+        # (layout, KEY_* of each key of layout), replaced as a whole per frame
+        self.key_states = None
         
-        # typed letters
-        self.typed = ""
+        # typed letters, edited at the cursor (see text_buffer.py)
+        # text_lines are the last text_rows rows up to the cursor, wrapped to
+        # the frame width and laid out again only from the first edit
+        # keys are typed from another thread than the frame size is set from
+        self.text = GapBuffer()
+        self.text_rows = 3
+        self.text_view = TextView(self.text, rows=self.text_rows)
+        self.text_lines = ()
+        self.text_lock = threading.Lock()
+
+        # completions of the word before the cursor (see completion.py),
+        # followed letter by letter from a memory-mapped trie of words/en.txt
+        self.completer = None
+        self.suggestions = ()
+        try:
+            trie = load_trie(os.path.join(WORDS_DIR, "en.txt"), len(SUGGESTION_KEYS))
+            self.completer = Completer(trie)
+            self.suggestions = tuple(self.completer.suggestions)
+        except Exception as e:
+            print("word completion unavailable", e)
+
+        # spelling correction of each word when a space ends it (see
+        # correction.py): neighbouring keys of the layout and swapped letters
+        # set autocorrect = False to type words as they are
+        self.autocorrect = True
+        self.corrector = None
+        try:
+            index = load_index(os.path.join(WORDS_DIR, "en.txt"))
+            self.corrector = Corrector(index)
+        except Exception as e:
+            print("spelling correction unavailable", e)
+
+        # typed text is rasterized again only when it changes
+        self.hud = Hud()
+
+        self.set_layout("qwerty")
 
     def type_key(self, letter):
         # print(f"type key {letter}")
-        if letter == "←":
-            if self.typed != "":
-                self.typed = self.typed[:-1]
-        else:
-            self.typed += letter
-        
+        with self.text_lock:
+            if letter in SUGGESTION_KEYS:
+                self.complete_word(SUGGESTION_KEYS.index(letter))
+            elif letter == "←":
+                self.text.backspace()
+            elif letter == "↶":
+                self.text.undo()
+            elif letter.isspace():
+                self.end_word(letter)
+            else:
+                self.text.insert(letter)
+            self.update_text_lines()
+
+    # replace the word before the cursor with suggestion id and a space
+    # recorded as one edit, so undo() brings back the word as typed
+    # callers hold text_lock
+    def complete_word(self, id):
+        if id >= len(self.suggestions):
+            return
+        word = self.text.current_word()
+        self.text.replace(len(word), match_case(word, self.suggestions[id]) + " ")
+
+    # type space after the word before the cursor, corrected if misspelled
+    # the correction is one edit after the space, so undo() brings back the
+    # word as typed, space included
+    # callers hold text_lock
+    def end_word(self, space):
+        correction = None
+        word = self.text.current_word()
+        if self.autocorrect and self.corrector is not None:
+            correction = self.corrector.correct(word)
+        self.text.insert(space)
+        if correction is not None:
+            self.text.replace(len(word) + 1, match_case(word, correction) + space)
+
+    # remove the word before the cursor
+    def delete_word(self):
+        with self.text_lock:
+            self.text.delete_word()
+            self.update_text_lines()
+
+    # revert the last edit (typing a word is one edit)
+    def undo(self):
+        with self.text_lock:
+            self.text.undo()
+            self.update_text_lines()
+
+    # whole typed text, costs its length (drawing uses text_lines)
+    @property
+    def typed(self):
+        with self.text_lock:
+            return self.text.text()
+
+    # callers hold text_lock
+    def update_text_lines(self):
+        self.text_view.update()
+        self.text_lines = self.text_view.visible()
+        if self.completer is not None:
+            word = self.text.current_word()
+            self.suggestions = tuple(self.completer.update(word))
+
+    # wrap text as wide as the frame leaves room for right of the text position
+    def fit_text_view(self):
+        font = self.text_font(self.layout)
+        (char_width, _), _ = cv2.getTextSize("W", font.face, font.scale, font.thickness)
+        width = self.frame_size[0] - 2 * self.layout.origin[0]
+        with self.text_lock:
+            self.text_view.resize(max(width // char_width, 1), self.text_rows)
+            self.text_lines = self.text_view.visible()
+
+    # switch to another layout page (name or KeyboardLayout)
+    def set_layout(self, layout):
+        if not isinstance(layout, KeyboardLayout):
+            layout = self.layouts[layout]
+        self.layout = layout
+
+        # read-only views of the current layout
+        self.keyboard_pos = layout.origin
+        self.keysize = layout.keysize
+        self.key_border = layout.key_border
+        self.letters = layout.rows
+        self.letter_pos = layout.key_pos
+        if self.corrector is not None:
+            self.corrector.set_layout(layout)
+        self.fit_text_view()
+
+    # rescale all layouts to the size of the frames actually received
+    def set_frame_size(self, width, height):
+        if (width, height) == self.frame_size:
+            return
+
+        self.frame_size = (width, height)
+        self.layouts = {
+            name: layout.fit(self.frame_size)
+            for name, layout in self.base_layouts.items()
+        }
+        self.overlays = {}
+        self.set_layout(self.layout.name)
+
+    # capture current state for rendering
+    def snapshot(self):
+        return KeyboardSnapshot(
+            self.layout, self.current_key_states(), self.text_lines, self.suggestions
+        )
+
+    # set the visual state of every key from the keys under fingertips and the
+    # keys being pressed, ids index layout.key_names and -1 is no key
+    def set_key_states(self, layout, hover_ids, pressed_ids):
+        hover_ids = np.asarray(hover_ids)
+        pressed_ids = np.asarray(pressed_ids)
+
+        key_states = np.full(len(layout.key_names), KEY_IDLE, dtype=np.uint8)
+        key_states[hover_ids[hover_ids >= 0]] = KEY_HOVER
+        key_states[pressed_ids[pressed_ids >= 0]] = KEY_PRESSED
+        self.key_states = (layout, key_states)
+
+    # key states of the current layout, None if not known (all idle)
+    def current_key_states(self):
+        key_states = self.key_states
+        if key_states is None or key_states[0] is not self.layout:
+            return None
+        return key_states[1]
+
+    # cycle through the loaded layout pages
+    def next_layout(self):
+        names = list(self.layouts)
+        id = names.index(self.layout.name) if self.layout.name in names else -1
+        self.set_layout(names[(id + 1) % len(names)])
+
     # return which key (x, y) lies on
-    def query_key_id(self, x_norm, y_norm):        
-        x = int(x_norm * 1280)
-        y = int(y_norm * 720)
-                
-        for key, pos in self.letter_pos.items():
-            # print(f"checking {key} {pos}")
-            if pos[0] <= x and x <= pos[0] + self.keysize \
-                and pos[1] <= y and y <= pos[1] + self.keysize:
-                    # print(f"key name of {x}, {y} is {key}")
-                    return key
-        
-        # print("no key is at query coordinates")
-        return -1
-        
-        
-    def draw_key(self, img, text, topx, topy):
-        # mark letter key position
-        self.letter_pos[text] = (topx, topy)
-        
+    def query_key_id(self, x_norm, y_norm):
+        layout = self.layout
+        width, height = layout.frame_size
+        return layout.key_at(int(x_norm * width), int(y_norm * height))
+
+    # batch version of query_key_id for an (n, 2) array of normalized points
+    # returns index into layout.key_names for each point, -1 if not on a key
+    # layout defaults to the current one
+    def query_key_ids(self, points_norm, layout=None):
+        if layout is None:
+            layout = self.layout
+        points = np.asarray(points_norm, dtype=np.float32).reshape(-1, 2)
+        return layout.keys_at(points * layout.frame_size)
+
+    # text offset inside a key and font scale for the frame size of layout
+    def key_text_format(self, layout):
+        text_x = int(round(self.text_pos[0] * layout.scale))
+        text_y = int(round(self.text_pos[1] * layout.scale))
+        return (text_x, text_y), self.fontscale * layout.scale
+
+    # width defaults to the key size (a square key)
+    def draw_key(self, img, text, topx, topy, width=None):
+        if width is None:
+            width = self.keysize
+
         # draw semi-transparent key
-        img_key = img[topy : topy + self.keysize, topx : topx + self.keysize]
+        img_key = img[topy : topy + self.keysize, topx : topx + width]
 
         key_rect = np.ones(img_key.shape, dtype=np.uint8)
         key_rect[:] = self.keycolor
@@ -71,53 +279,176 @@ class Keyboard:
             beta=1 - self.key_opacity,
             gamma=0,
         )
-        img[topy : topy + self.keysize, topx : topx + self.keysize] = img_key
+        img[topy : topy + self.keysize, topx : topx + width] = img_key
 
         # draw key letter
-        if text == "←":
-            text = "<-"
-            
+        text_pos, fontscale = self.key_text_format(self.layout)
         cv2.putText(
             img=img,
-            text=text,
-            org=(topx + self.text_pos[0], topy + self.text_pos[1]),
+            text=self.layout.label(text),
+            org=(topx + text_pos[0], topy + text_pos[1]),
             fontFace=self.fonttype,
-            fontScale=self.fontscale,
+            fontScale=fontscale,
             color=self.fontcolor,
             thickness=1,
         )
 
-    def draw_typed_words(self, src_img):
-        img = np.copy(src_img)
-        x, y = self.keyboard_pos[0], self.keyboard_pos[1] - 150
-        text = self.typed
-        cv2.putText(
-            img=img,
-            text=text,
-            org=(x, y),
-            fontFace=self.fonttype,
-            fontScale=self.fontscale,
-            color=self.fontcolor,
-            thickness=1,
-        )
+    def draw_typed_words(self, src_img, state=None):
+        if state is None:
+            state = self.snapshot()
+
+        img = src_img  # drawn in place
+        # the row with the cursor stays in place, earlier rows above it
+        lines = state.text_lines
+        line_height = int(round(40 * state.layout.scale))
+        x = state.layout.origin[0]
+        y = state.layout.origin[1] - int(round(150 * state.layout.scale))
+        y -= line_height * max(len(lines) - 1, 0)
+        font = self.text_font(state.layout)
+        self.hud.text(img, (x, y), lines, font, self.fontcolor, line_height)
+        return img
+
+    # write the suggestions on the suggestion keys of the layout
+    def draw_suggestions(self, img, state):
+        layout = state.layout
+        text_pos, _ = self.key_text_format(layout)
+        font = self.text_font(layout)
+        for key, suggestion in zip(SUGGESTION_KEYS, state.suggestions):
+            if key in layout.key_pos:
+                x, y = layout.key_pos[key]
+                origin = (x + text_pos[0], y + text_pos[1])
+                self.hud.text(img, origin, [suggestion.upper()], font, self.fontcolor)
         return img
+
+    def text_font(self, layout):
+        return TextFont(self.fonttype, self.fontscale * layout.scale, 1, cv2.LINE_8)
     
+    # everything the overlay depends on, rebuild when any of these changes
+    def overlay_cache_key(self, layout):
+        return (
+            layout,
+            self.key_opacity,
+            self.keycolor,
+            self.fontcolor,
+            self.fontscale,
+            self.hovercolor,
+            self.presscolor,
+            self.key_type_opacity,
+        )
+
+    # pre-render all keys of layout in every state, starting with all keys idle
+    def build_overlay(self, layout):
+        variants = [
+            self.render_keys(layout, self.keycolor, self.key_opacity),  # KEY_IDLE
+            self.render_keys(layout, self.hovercolor, self.key_opacity),  # KEY_HOVER
+            self.render_keys(layout, self.presscolor, self.key_type_opacity),
+        ]
+        alpha, base = variants[KEY_IDLE]
+        left, top = layout.bbox[:2]
+
+        return (
+            (left, top),
+            alpha.copy(),
+            base.copy(),
+            np.empty(base.shape, dtype=np.uint8),
+            variants,
+            np.full(len(layout.key_names), KEY_IDLE, dtype=np.uint8),
+        )
+
+    # pre-render all keys and glyphs of layout over its bounding box
+    # with keys in keycolor, returns alpha and base
+    # per frame: out = img * alpha / 255 + base
+    def render_keys(self, layout, keycolor, key_opacity):
+        left, top, right, bottom = layout.bbox
+        text_pos, fontscale = self.key_text_format(layout)
+
+        # weight of the frame pixel (1 outside keys) and glyph coverage
+        alpha = np.ones((bottom - top, right - left), dtype=np.float32)
+        glyph_mask = np.zeros(alpha.shape, dtype=np.uint8)
+
+        for letter, (x, y), (width, height) in zip(
+            layout.key_names, layout.key_rects - (left, top), layout.key_sizes
+        ):
+            alpha[y : y + height, x : x + width] = key_opacity
+            cv2.putText(
+                img=glyph_mask,
+                text=layout.label(letter),
+                org=(int(x) + text_pos[0], int(y) + text_pos[1]),
+                fontFace=self.fonttype,
+                fontScale=fontscale,
+                color=255,
+                thickness=1,
+            )
+
+        # key background: img * opacity + keycolor * (1 - opacity)
+        # glyphs are then drawn opaque on top of the keys
+        glyph = (glyph_mask.astype(np.float32) / 255)[..., None]
+        alpha = alpha[..., None]
+        base = (1 - alpha) * np.array(keycolor, dtype=np.float32)
+        base = base * (1 - glyph) + glyph * np.array(self.fontcolor, dtype=np.float32)
+        alpha = np.repeat(alpha * (1 - glyph), 3, axis=2)
+
+        return np.rint(alpha * 255).astype(np.uint8), np.rint(base).astype(np.uint8)
+
+    # bring the overlay tiles of keys whose state changed up to date
+    def update_tiles(self, overlay, layout, key_states):
+        (left, top), alpha, base, _, variants, tile_states = overlay
+        if key_states is None:
+            key_states = np.full(len(tile_states), KEY_IDLE, dtype=np.uint8)
+
+        for key_id in np.flatnonzero(key_states != tile_states):
+            x, y = layout.key_rects[key_id] - (left, top)
+            width, height = layout.key_sizes[key_id]
+            tile = (slice(y, y + height), slice(x, x + width))
+            state_alpha, state_base = variants[key_states[key_id]]
+            alpha[tile] = state_alpha[tile]
+            base[tile] = state_base[tile]
+            tile_states[key_id] = key_states[key_id]
+
+    # blend the cached overlay onto img in place
+    def blend_overlay(self, img, layout, key_states=None):
+        key = self.overlay_cache_key(layout)
+        if key not in self.overlays:
+            self.overlays[key] = self.build_overlay(layout)
+        overlay = self.overlays[key]
+        self.update_tiles(overlay, layout, key_states)
+        (left, top), overlay_alpha, overlay_base, overlay_buffer = overlay[:4]
+
+        # clip overlay to the frame
+        img_h, img_w = img.shape[:2]
+        height, width = overlay_alpha.shape[:2]
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + width, img_w), min(top + height, img_h)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        roi = img[y0:y1, x0:x1]
+        crop = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        buffer = overlay_buffer[crop]
+
+        cv2.multiply(roi, overlay_alpha[crop], dst=buffer, scale=1 / 255)
+        cv2.add(buffer, overlay_base[crop], dst=buffer)
+        roi[:] = buffer
+
     # draw keyboard on image
-    def draw_keyboard_on_img(self, src_img):
+    def draw_keyboard_on_img(self, src_img, state=None):
+        if state is None:
+            state = self.snapshot()
+
         # print("start draw keyboard", src_img.shape)
-        img = np.copy(src_img)
+        img = src_img  # drawn in place
         try:
-            (cur_x, cur_y) = self.keyboard_pos
-            for id, row in enumerate(self.letters):
-                for letter in row:
-                    # print(letter)
-                    self.draw_key(img, letter, cur_x, cur_y)
-                    cur_x += self.keysize + self.key_border
-
-                cur_y += self.keysize + self.key_border
-                cur_x = self.keyboard_pos[0] + (self.keysize // 2) * (id + 1)
-            
-            img = self.draw_typed_words(img)
+            if self.use_overlay_cache:
+                self.blend_overlay(img, state.layout, state.key_states)
+            else:
+                layout = state.layout
+                for letter, (x, y), (width, _) in zip(
+                    layout.key_names, layout.key_rects, layout.key_sizes
+                ):
+                    self.draw_key(img, letter, int(x), int(y), int(width))
+
+            img = self.draw_suggestions(img, state)
+            img = self.draw_typed_words(img, state)
         except Exception as e:
             print(e)
     
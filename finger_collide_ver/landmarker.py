@@ -1,9 +1,41 @@
+from collections import namedtuple
+
 import mediapipe as mp
 
+# HandLandmarker settings
+#   model_path: .task model bundle
+#   num_hands: most hands detected, 1 halves the work of single hand setups
+#   min_detection_confidence: palm detector score to accept a hand
+#   min_presence_confidence: landmark model score to keep tracking a hand,
+#     below it the palm detector runs again on the next frame
+#   min_tracking_confidence: overlap of the tracked and predicted hand box
+#     needed to keep tracking (VIDEO and LIVE_STREAM modes)
+#   running_mode: "live_stream", "video" or "image" (or a RunningMode)
+#   delegate: "cpu", "gpu" or None for the default
+LandmarkerConfig = namedtuple(
+    "LandmarkerConfig",
+    [
+        "model_path",
+        "num_hands",
+        "min_detection_confidence",
+        "min_presence_confidence",
+        "min_tracking_confidence",
+        "running_mode",
+        "delegate",
+    ],
+    defaults=["hand_landmarker.task", 2, 0.5, 0.5, 0.5, "live_stream", None],
+)
+
+RUNNING_MODES = ("live_stream", "video", "image")
+DELEGATES = ("cpu", "gpu")
+
 
 class HandLandmarker:
-    def __init__(self, func):
-        self.hand_landmarker_path = "hand_landmarker.task"
+    # func receives results in LIVE_STREAM mode, VIDEO and IMAGE modes return them
+    def __init__(self, func=None, config=None):
+        self.config = config or LandmarkerConfig()
+        self.hand_landmarker_path = self.config.model_path
+        self.running_mode = self.get_running_mode()
 
         self.options = self.set_options(func)
 
@@ -11,16 +43,53 @@ class HandLandmarker:
             self.options
         )
 
+    def get_running_mode(self):
+        running_mode = self.config.running_mode
+        if isinstance(running_mode, str):
+            running_mode = mp.tasks.vision.RunningMode[running_mode.upper()]
+        return running_mode
+
+    def get_delegate(self):
+        delegate = self.config.delegate
+        if isinstance(delegate, str):
+            delegate = mp.tasks.BaseOptions.Delegate[delegate.upper()]
+        return delegate
+
     def set_options(self, func):
         BaseOptions = mp.tasks.BaseOptions
         HandLandmarkerOptions = mp.tasks.vision.HandLandmarkerOptions
         VisionRunningMode = mp.tasks.vision.RunningMode
+        config = self.config
+
+        # result callback is only allowed in LIVE_STREAM mode
+        live_stream = self.running_mode == VisionRunningMode.LIVE_STREAM
 
         options = HandLandmarkerOptions(
-            base_options=BaseOptions(model_asset_path=self.hand_landmarker_path),
-            running_mode=VisionRunningMode.LIVE_STREAM,
-            num_hands=2,
-            result_callback=func,
+            base_options=BaseOptions(
+                model_asset_path=self.hand_landmarker_path,
+                delegate=self.get_delegate(),
+            ),
+            running_mode=self.running_mode,
+            num_hands=config.num_hands,
+            min_hand_detection_confidence=config.min_detection_confidence,
+            min_hand_presence_confidence=config.min_presence_confidence,
+            min_tracking_confidence=config.min_tracking_confidence,
+            result_callback=func if live_stream else None,
         )
 
         return options
+
+    # run the landmarker on mp_image in its running mode
+    # returns the result in VIDEO and IMAGE modes, None in LIVE_STREAM mode
+    # (the result goes to func)
+    def detect(self, mp_image, timestamp):
+        VisionRunningMode = mp.tasks.vision.RunningMode
+        if self.running_mode == VisionRunningMode.LIVE_STREAM:
+            self.landmarker.detect_async(mp_image, timestamp)
+            return None
+        if self.running_mode == VisionRunningMode.VIDEO:
+            return self.landmarker.detect_for_video(mp_image, timestamp)
+        return self.landmarker.detect(mp_image)
+
+    def close(self):
+        self.landmarker.close()
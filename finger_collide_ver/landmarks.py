@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+import numpy as np
+
+NUM_LANDMARKS = 21
+HANDEDNESS_NAMES = ("Left", "Right")
+HANDEDNESS_IDS = {name: index for index, name in enumerate(HANDEDNESS_NAMES)}
+
+# landmarker result as contiguous arrays, one row per detected hand
+#   landmarks: (hands, 21, 3) normalized coordinates
+#   world_landmarks: (hands, 21, 3) world coordinates in meters
+#   handedness: (hands,) index into HANDEDNESS_NAMES
+#   handedness_score: (hands,)
+# arrays are never written to after conversion, so they can be shared
+HandArrays = namedtuple(
+    "HandArrays",
+    ["landmarks", "world_landmarks", "handedness", "handedness_score"],
+)
+
+
+def empty_hands():
+    return HandArrays(
+        np.zeros((0, NUM_LANDMARKS, 3), dtype=np.float32),
+        np.zeros((0, NUM_LANDMARKS, 3), dtype=np.float32),
+        np.zeros(0, dtype=np.int8),
+        np.zeros(0, dtype=np.float32),
+    )
+
+
+# convert a HandLandmarkerResult once, consumers slice the arrays afterwards
+def result_arrays(result):
+    if result is None or not result.handedness:
+        return empty_hands()
+
+    shape = (len(result.handedness), NUM_LANDMARKS, 3)
+    landmarks = np.array(
+        [[(lm.x, lm.y, lm.z) for lm in hand] for hand in result.hand_landmarks],
+        dtype=np.float32,
+    ).reshape(shape)
+    world_landmarks = np.array(
+        [[(lm.x, lm.y, lm.z) for lm in hand] for hand in result.hand_world_landmarks],
+        dtype=np.float32,
+    ).reshape(shape)
+    handedness = np.array(
+        [HANDEDNESS_IDS[hand[0].category_name] for hand in result.handedness],
+        dtype=np.int8,
+    )
+    handedness_score = np.array(
+        [hand[0].score for hand in result.handedness], dtype=np.float32
+    )
+
+    return HandArrays(landmarks, world_landmarks, handedness, handedness_score)
+
+
+# mirror hands horizontally, as if the input frame had been flipped
+# lets the app skip flipping pixels before inference
+def mirror_hands(hands):
+    # normalized x is in [0, 1] of frame width, world x is centered on the hand
+    landmarks = hands.landmarks.copy()
+    landmarks[..., 0] = 1 - landmarks[..., 0]
+    world_landmarks = hands.world_landmarks.copy()
+    world_landmarks[..., 0] *= -1
+
+    return HandArrays(
+        landmarks, world_landmarks, 1 - hands.handedness, hands.handedness_score
+    )
@@ -0,0 +1,174 @@
+import json
+import os
+
+import numpy as np
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts")
+
+# frame size (width, height) layout geometry is specified for
+REFERENCE_FRAME_SIZE = (1280, 720)
+
+
+class KeyboardLayout:
+    def __init__(
+        self,
+        name,
+        rows,
+        origin,
+        keysize,
+        key_border,
+        row_offsets=None,
+        labels=None,
+        key_widths=None,
+        frame_size=REFERENCE_FRAME_SIZE,
+    ):
+        self.name = name
+        self.rows = [list(row) for row in rows]
+
+        # geometry in pixels of a frame_size frame, origin = top left corner
+        self.frame_size = tuple(frame_size)
+        self.scale = min(
+            self.frame_size[0] / REFERENCE_FRAME_SIZE[0],
+            self.frame_size[1] / REFERENCE_FRAME_SIZE[1],
+        )
+        self.origin = tuple(origin)
+        self.keysize = keysize
+        self.key_border = key_border
+
+        # horizontal offset of each row in keys (half a key stagger per row by default)
+        if row_offsets is None:
+            row_offsets = [0.5 * id for id in range(len(self.rows))]
+        self.row_offsets = list(row_offsets)
+
+        # display text for keys that cannot be drawn as is (e.g. "←")
+        self.labels = dict(labels or {})
+
+        # width in keys of keys wider than one key (e.g. a space bar), a key
+        # w keys wide covers the borders between them too
+        self.key_widths = dict(key_widths or {})
+
+        # computed once from the spec above
+        self.key_names = []         # name of key i
+        self.key_rects = None       # (n, 2) top left corner of key i
+        self.key_sizes = None       # (n, 2) width and height of key i
+        self.key_pos = {}           # key name -> top left corner
+        self.bbox = None            # (left, top, right, bottom)
+        self.key_map = None         # label map over bbox, 0 = no key, i + 1 = key i
+        self.compute()
+
+    # build layout from a spec dict, geometry missing from spec is taken from defaults
+    @classmethod
+    def from_spec(cls, spec, **defaults):
+        params = dict(defaults)
+        params.update(spec)
+        return cls(
+            name=params["name"],
+            rows=params["rows"],
+            origin=params["origin"],
+            keysize=params["keysize"],
+            key_border=params["key_border"],
+            row_offsets=params.get("row_offsets"),
+            labels=params.get("labels"),
+            key_widths=params.get("key_widths"),
+            frame_size=params.get("frame_size", REFERENCE_FRAME_SIZE),
+        )
+
+    # load layout from a json spec file
+    @classmethod
+    def load(cls, path, **defaults):
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        spec.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+        return cls.from_spec(spec, **defaults)
+
+    # copy of this layout rescaled to another frame size, aspect ratio kept
+    def fit(self, frame_size):
+        scale = min(
+            frame_size[0] / self.frame_size[0], frame_size[1] / self.frame_size[1]
+        )
+        origin = tuple(int(round(coord * scale)) for coord in self.origin)
+        return KeyboardLayout(
+            name=self.name,
+            rows=self.rows,
+            origin=origin,
+            keysize=max(int(round(self.keysize * scale)), 1),
+            key_border=int(round(self.key_border * scale)),
+            row_offsets=self.row_offsets,
+            labels=self.labels,
+            key_widths=self.key_widths,
+            frame_size=frame_size,
+        )
+
+    # compute key rectangles and the hit-test label map
+    def compute(self):
+        step = self.keysize + self.key_border
+        positions = []
+        for id, row in enumerate(self.rows):
+            x = self.origin[0] + int(round(self.row_offsets[id] * self.keysize))
+            y = self.origin[1] + id * step
+            for key in row:
+                keys = self.key_widths.get(key, 1)
+                width = int(round(keys * step)) - self.key_border
+                positions.append((key, x, y, width))
+                x += width + self.key_border
+
+        self.key_names = [key for key, _, _, _ in positions]
+        self.key_rects = np.array(
+            [(x, y) for _, x, y, _ in positions], dtype=np.int32
+        )
+        self.key_sizes = np.array(
+            [(width, self.keysize) for _, _, _, width in positions], dtype=np.int32
+        )
+        self.key_pos = {key: (x, y) for key, x, y, _ in positions}
+
+        left, top = self.key_rects.min(axis=0)
+        right, bottom = (self.key_rects + self.key_sizes).max(axis=0)
+        self.bbox = (int(left), int(top), int(right), int(bottom))
+
+        # key edges are inclusive
+        key_map = np.zeros((bottom - top + 1, right - left + 1), dtype=np.uint8)
+        for id, ((x, y), (width, height)) in enumerate(
+            zip(self.key_rects - (left, top), self.key_sizes)
+        ):
+            key_map[y : y + height + 1, x : x + width + 1] = id + 1
+        self.key_map = key_map
+
+    # display text of a key
+    def label(self, key):
+        return self.labels.get(key, key)
+
+    # name of key at pixel (x, y), -1 if not on a key
+    def key_at(self, x, y):
+        x -= self.bbox[0]
+        y -= self.bbox[1]
+
+        height, width = self.key_map.shape
+        if 0 <= x < width and 0 <= y < height:
+            label = self.key_map[y, x]
+            if label:
+                return self.key_names[label - 1]
+
+        return -1
+
+    # index into key_names for an (n, 2) array of pixel coordinates, -1 if not on a key
+    def keys_at(self, points):
+        points = np.asarray(points).reshape(-1, 2)
+        x = points[:, 0].astype(np.int32) - self.bbox[0]
+        y = points[:, 1].astype(np.int32) - self.bbox[1]
+
+        height, width = self.key_map.shape
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+
+        ids = np.full(len(points), -1, dtype=np.int32)
+        ids[inside] = self.key_map[y[inside], x[inside]].astype(np.int32) - 1
+        return ids
+
+
+# load every layout in directory, keyed by name
+def load_layouts(directory=LAYOUT_DIR, **defaults):
+    layouts = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            layout = KeyboardLayout.load(os.path.join(directory, filename), **defaults)
+            layouts[layout.name] = layout
+    return layouts
@@ -0,0 +1,90 @@
+import threading
+import time
+
+
+class FrameScheduler:
+    # paces a loop to a target fps by sleeping only what is left of each frame
+    # interval after the work done in it, target_fps None runs uncapped
+    #
+    # low power mode (idle_fps set): after idle_after seconds without activity
+    # (no hands detected) the loop drops to idle_fps, first activity wakes it up
+    def __init__(self, target_fps=30, idle_fps=None, idle_after=2.0):
+        self.target_fps = target_fps
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+
+        self.frame_start = time.perf_counter()
+        self.last_active = self.frame_start
+        self.idle = False
+        self.wake_event = threading.Event()
+
+        # statistics
+        self.frames = 0
+        self.fps = 0.0  # smoothed measured rate
+
+    def current_fps(self):
+        return self.idle_fps if self.idle else self.target_fps
+
+    # report whether the last frame had anything to track (e.g. hands)
+    def report_activity(self, active):
+        now = time.perf_counter()
+        if active:
+            self.last_active = now
+            if self.idle:
+                self.idle = False
+                self.wake_event.set()
+        elif self.idle_fps and now - self.last_active >= self.idle_after:
+            self.idle = True
+
+    # seconds left until the next frame is due
+    def remaining(self):
+        fps = self.current_fps()
+        if not fps:
+            return 0.0
+        return max(1 / fps - (time.perf_counter() - self.frame_start), 0.0)
+
+    # block until the next frame is due, returns early when woken from idle
+    def wait(self):
+        remaining = self.remaining()
+        if remaining > 0:
+            self.wake_event.wait(remaining)
+        self.wake_event.clear()
+
+        now = time.perf_counter()
+        elapsed = now - self.frame_start
+        self.frame_start = now
+
+        self.frames += 1
+        if elapsed > 0:
+            self.fps = 0.9 * self.fps + 0.1 / elapsed if self.fps else 1 / elapsed
+
+    def stats(self):
+        return {
+            "fps": round(self.fps, 1),
+            "target": self.current_fps(),
+            "idle": self.idle,
+        }
+
+
+class TimestampSource:
+    # strictly increasing millisecond timestamps for the landmarker
+    # monotonic clock, so wall clock steps (e.g. NTP) cannot move them back,
+    # and frames within the same millisecond get the next free one
+    def __init__(self):
+        self.start = time.monotonic()
+        self.last = -1
+
+        # statistics
+        self.bumped = 0  # timestamps moved forward to stay increasing
+
+    # milliseconds since the source was created, always > the previous one
+    def next(self):
+        timestamp = int((time.monotonic() - self.start) * 1000)
+        if timestamp <= self.last:
+            timestamp = self.last + 1
+            self.bumped += 1
+        self.last = timestamp
+        return timestamp
+
+    def stats(self):
+        return {"last": self.last, "bumped": self.bumped}
@@ -0,0 +1,250 @@
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+import numpy as np
+
+# a frame submitted for inference
+#   frame: full frame kept for rendering (None if the worker returns it)
+#   captured, submitted: time.perf_counter() when read and when submitted
+#   data: anything else the result needs (e.g. a crop rect)
+InFlight = namedtuple(
+    "InFlight", ["timestamp", "frame", "captured", "submitted", "data"]
+)
+
+
+class LatestQueue:
+    # bounded queue between pipeline stages
+    # when full the oldest item is dropped, so consumers always get the latest frame
+    def __init__(self, name, maxsize=1):
+        self.name = name
+        self.maxsize = maxsize
+        self.items = deque()
+        self.cond = threading.Condition()
+
+        # statistics
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.put_count += 1
+            self.cond.notify()
+
+    # oldest item in queue, None if nothing arrives within timeout
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+    def depth(self):
+        return len(self.items)
+
+    def stats(self):
+        return {"depth": self.depth(), "put": self.put_count, "dropped": self.dropped}
+
+
+class StageThread(threading.Thread):
+    # runs step() in a loop until stopped
+    # step returns True when it processed an item
+    def __init__(self, name, step):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.stop_event = threading.Event()
+
+        # statistics
+        self.processed = 0
+        self.errors = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.step():
+                    self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"{self.name} exception", e)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        return {"processed": self.processed, "errors": self.errors}
+
+
+class SnapshotSlot:
+    # single-slot handoff of immutable snapshots between two threads
+    # publish() swaps one reference, so the reader never sees a half-updated
+    # state and neither side waits for the other to finish its work
+    # a snapshot not taken before the next publish is dropped
+    def __init__(self, name):
+        self.name = name
+        self.snapshot = None
+        self.last_taken = None
+        self.ready = threading.Event()
+
+        # statistics
+        self.published = 0
+        self.consumed = 0
+
+    def publish(self, snapshot):
+        self.snapshot = snapshot
+        self.published += 1
+        self.ready.set()
+
+    # newest snapshot not taken yet, None if nothing arrives within timeout
+    def take(self, timeout=None):
+        if not self.ready.wait(timeout):
+            return None
+        self.ready.clear()
+
+        snapshot = self.snapshot
+        if snapshot is self.last_taken:
+            return None
+
+        self.last_taken = snapshot
+        self.consumed += 1
+        return snapshot
+
+    def depth(self):
+        return 1 if self.ready.is_set() else 0
+
+    def stats(self):
+        depth = self.depth()
+        return {
+            "depth": depth,
+            "put": self.published,
+            "dropped": self.published - self.consumed - depth,
+        }
+
+
+class FrameRing:
+    # preallocated frame buffers reused round robin, so stages write frames
+    # into existing memory instead of allocating new arrays every frame
+    # size must exceed the number of frames in use at once by its stages
+    def __init__(self, size):
+        self.size = size
+        self.buffers = []
+        self.index = 0
+
+    # next free buffer, reallocated when the frame shape changes
+    def next(self, shape, dtype=np.uint8):
+        if not self.buffers or self.buffers[0].shape != shape:
+            self.buffers = [np.empty(shape, dtype=dtype) for _ in range(self.size)]
+            self.index = 0
+
+        buffer = self.buffers[self.index]
+        self.index = (self.index + 1) % self.size
+        return buffer
+
+
+# count, mean and percentiles in milliseconds of durations in seconds
+def latency_summary(durations):
+    if not durations:
+        return {"count": 0}
+
+    ms = np.asarray(durations, dtype=np.float64) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+    }
+
+
+class InferenceTracker:
+    # frames submitted to an asynchronous worker (the landmarker) until their
+    # result arrives, keyed by timestamp
+    # at most max_in_flight frames at once, the submitting stage waits for a free
+    # slot while newer captures replace the frame it would have sent, so a busy
+    # worker gets the latest frame next instead of a backlog
+    # results of frames the worker skipped never arrive: they are dropped once a
+    # newer result arrives, or after expire_after seconds
+    def __init__(self, max_in_flight=1, expire_after=1.0, window=256):
+        self.max_in_flight = max_in_flight
+        self.expire_after = expire_after
+        self.in_flight = OrderedDict()
+        self.cond = threading.Condition()
+
+        # statistics, latencies of the last window results and keystrokes
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.dropped = 0
+        self.waits = 0  # times the submitting stage found no free slot
+        self.result_latency = deque(maxlen=window)  # capture -> result
+        self.keystroke_latency = deque(maxlen=window)  # capture -> key typed
+
+    # block until a frame can be submitted, False if none within timeout
+    def wait_slot(self, timeout=None):
+        with self.cond:
+            self.expire()
+            if len(self.in_flight) < self.max_in_flight:
+                return True
+
+            self.waits += 1
+            return self.cond.wait_for(
+                lambda: self.expire() < self.max_in_flight, timeout
+            )
+
+    # drop frames waiting too long for a result, returns frames still in flight
+    # callers hold cond
+    def expire(self):
+        now = time.perf_counter()
+        while self.in_flight:
+            oldest = next(iter(self.in_flight.values()))
+            if now - oldest.submitted < self.expire_after:
+                break
+            self.in_flight.popitem(last=False)
+            self.dropped += 1
+        return len(self.in_flight)
+
+    # register entry before handing its frame to the worker,
+    # the result may arrive before the submitting call returns
+    def submit(self, entry):
+        with self.cond:
+            self.in_flight[entry.timestamp] = entry
+            self.submitted += 1
+
+    # the worker refused the frame of timestamp
+    def reject(self, timestamp):
+        with self.cond:
+            self.in_flight.pop(timestamp, None)
+            self.rejected += 1
+            self.cond.notify_all()
+
+    # entry of the frame a result belongs to, None if it expired
+    # frames submitted before it get no result any more
+    def complete(self, timestamp):
+        with self.cond:
+            entry = self.in_flight.pop(timestamp, None)
+            for older in [t for t in self.in_flight if t < timestamp]:
+                del self.in_flight[older]
+                self.dropped += 1
+            self.cond.notify_all()
+
+        if entry is not None:
+            self.completed += 1
+            self.result_latency.append(time.perf_counter() - entry.captured)
+        return entry
+
+    # the result of entry typed a key
+    def keystroke(self, entry):
+        self.keystroke_latency.append(time.perf_counter() - entry.captured)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.in_flight),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "waits": self.waits,
+            "result_latency": latency_summary(list(self.result_latency)),
+            "keystroke_latency": latency_summary(list(self.keystroke_latency)),
+        }
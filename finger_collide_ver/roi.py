@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+from landmarks import HandArrays
+
+
+class InferenceRoi:
+    # region of the frame the landmarker runs on: the keyboard and the hands of
+    # the previous result, each with a margin, so inference skips the rest
+    # the region is kept while it covers both, so consecutive frames share the
+    # same crop and the landmarker keeps tracking hands instead of running palm
+    # detection again; it is snapped to a coarse grid whenever it changes
+    #   margin: added around the keyboard, fraction of frame height
+    #     (leaves room for the palm of a hand typing on the top or bottom row)
+    #   hand_margin: added around each hand, fraction of frame height
+    #   grid: cell size the region edges snap to, fraction of frame height
+    #   slack: extra room a changed region gets beyond the margins, so a moving
+    #     hand does not change it again on the next frame
+    #   shrink: the region shrinks back once it reaches this much further than
+    #     needed on a side (shrink > slack, so it does not flip back and forth)
+    #   max_width: wider regions are downsampled to it, None keeps the resolution
+    # rects are (left, top, right, bottom) in pixels of the frame
+    def __init__(
+        self,
+        margin=0.2,
+        hand_margin=0.1,
+        grid=0.05,
+        slack=0.05,
+        shrink=0.2,
+        max_width=None,
+    ):
+        self.margin = margin
+        self.hand_margin = hand_margin
+        self.grid = grid
+        self.slack = slack
+        self.shrink = shrink
+        self.max_width = max_width
+
+        # (frame_size, rect) used last, rect in displayed frame coordinates
+        self.current = None
+
+        # statistics
+        self.frames = 0
+        self.changes = 0  # frames the region differed from the previous one
+        self.area = 0.0  # summed fraction of the frame inferred on
+
+    # region for the next frame, keyboard_bbox in pixels and detection in
+    # normalized coordinates of the displayed (mirrored) frame
+    # mirrored: the frame given to the landmarker is not flipped yet
+    def rect(self, frame_size, keyboard_bbox, detection, mirrored=False):
+        width, height = frame_size
+        needed = self.needed_rect(frame_size, keyboard_bbox, detection)
+
+        rect = None
+        if self.current is not None and self.current[0] == frame_size:
+            rect = self.current[1]
+            loose = self.snap(needed, self.shrink * height, frame_size)
+            if not contains(rect, needed) or not contains(loose, rect):
+                rect = None
+
+        if rect is None:
+            rect = self.snap(needed, self.slack * height, frame_size)
+            self.changes += 1
+        self.current = (frame_size, rect)
+
+        left, top, right, bottom = rect
+        if mirrored:
+            left, right = width - right, width - left
+
+        self.frames += 1
+        self.area += (right - left) * (bottom - top) / (width * height)
+        return left, top, right, bottom
+
+    # keyboard and hands with their margins inside the displayed frame, unrounded
+    def needed_rect(self, frame_size, keyboard_bbox, detection):
+        width, height = frame_size
+
+        margin = self.margin * height
+        left, top, right, bottom = keyboard_bbox
+        left, top = left - margin, top - margin
+        right, bottom = right + margin, bottom + margin
+
+        if len(detection.handedness) > 0:
+            points = detection.landmarks[..., :2].reshape(-1, 2) * (width, height)
+            hand_margin = self.hand_margin * height
+            hand_left, hand_top = points.min(axis=0) - hand_margin
+            hand_right, hand_bottom = points.max(axis=0) + hand_margin
+            left, top = min(left, hand_left), min(top, hand_top)
+            right, bottom = max(right, hand_right), max(bottom, hand_bottom)
+
+        return max(left, 0), max(top, 0), min(right, width), min(bottom, height)
+
+    # rect grown by extra on each side and out to the grid, inside the frame
+    def snap(self, rect, extra, frame_size):
+        width, height = frame_size
+        cell = max(self.grid * height, 1)
+        left, top, right, bottom = rect
+        left = int(np.floor((left - extra) / cell) * cell)
+        top = int(np.floor((top - extra) / cell) * cell)
+        right = int(np.ceil((right + extra) / cell) * cell)
+        bottom = int(np.ceil((bottom + extra) / cell) * cell)
+        return max(left, 0), max(top, 0), min(right, width), min(bottom, height)
+
+    # pixels of frame inside rect, downsampled to max_width if wider
+    # returns a new contiguous image, frame is left untouched
+    def crop(self, frame, rect):
+        left, top, right, bottom = rect
+        region = frame[top:bottom, left:right]
+        if self.max_width is not None and right - left > self.max_width:
+            scale = self.max_width / (right - left)
+            return cv2.resize(
+                region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        return np.ascontiguousarray(region)
+
+    # landmarks found in the crop of rect, in normalized coordinates of the frame
+    # normalized z is scaled with the width like x, world landmarks are unchanged
+    def to_frame(self, detection, rect, frame_size):
+        width, height = frame_size
+        left, top, right, bottom = rect
+        crop_width, crop_height = right - left, bottom - top
+
+        scale = np.array(
+            [crop_width / width, crop_height / height, crop_width / width],
+            dtype=np.float32,
+        )
+        offset = np.array([left / width, top / height, 0], dtype=np.float32)
+
+        return HandArrays(
+            detection.landmarks * scale + offset,
+            detection.world_landmarks,
+            detection.handedness,
+            detection.handedness_score,
+        )
+
+    # stable: fraction of frames inferred on the same region as the one before
+    def stats(self):
+        area = self.area / self.frames if self.frames else 1.0
+        stable = 1 - self.changes / self.frames if self.frames else 1.0
+        return {
+            "frames": self.frames,
+            "changes": self.changes,
+            "stable": round(stable, 3),
+            "area": round(area, 3),
+        }
+
+
+# whether rect outer covers rect inner
+def contains(outer, inner):
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and outer[2] >= inner[2]
+        and outer[3] >= inner[3]
+    )
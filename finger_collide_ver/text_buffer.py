@@ -0,0 +1,277 @@
+from bisect import bisect_right
+from collections import deque, namedtuple
+
+# an edit, undone by applying its opposite: kind "insert" or "delete" of text
+# starting at position pos, or "replace" of removed by text
+Edit = namedtuple("Edit", ["kind", "pos", "text", "removed"], defaults=[""])
+
+
+class GapBuffer:
+    # editable text with a cursor, kept as a list of characters with a gap at
+    # the cursor: typing and deleting at the cursor cost O(1), moving the
+    # cursor costs the distance moved
+    # changed_from is the first position edited since take_changes(), so
+    # views only lay out again what follows it
+    def __init__(self, text="", capacity=64, undo_size=100):
+        self.chars = [""] * max(capacity, len(text))
+        self.gap_start = 0
+        self.gap_end = len(self.chars)
+        self.undo_ring = deque(maxlen=undo_size)
+        self.changed_from = None
+        self.insert(text, record=False)
+
+    def __len__(self):
+        return len(self.chars) - (self.gap_end - self.gap_start)
+
+    @property
+    def cursor(self):
+        return self.gap_start
+
+    def text(self):
+        return "".join(self.chars[: self.gap_start] + self.chars[self.gap_end :])
+
+    # characters in [start, end)
+    def slice(self, start, end):
+        gap = self.gap_end - self.gap_start
+        if end <= self.gap_start:
+            return "".join(self.chars[start:end])
+        if start >= self.gap_start:
+            return "".join(self.chars[start + gap : end + gap])
+        return "".join(
+            self.chars[start : self.gap_start] + self.chars[self.gap_end : end + gap]
+        )
+
+    def char_at(self, pos):
+        if pos >= self.gap_start:
+            pos += self.gap_end - self.gap_start
+        return self.chars[pos]
+
+    # first position edited since the last call, None if nothing was
+    def take_changes(self):
+        changed_from = self.changed_from
+        self.changed_from = None
+        return changed_from
+
+    def mark_changed(self, pos):
+        if self.changed_from is None or pos < self.changed_from:
+            self.changed_from = pos
+
+    ######## CURSOR #########
+    def move_to(self, pos):
+        pos = min(max(pos, 0), len(self))
+        if pos < self.gap_start:
+            count = self.gap_start - pos
+            self.chars[self.gap_end - count : self.gap_end] = self.chars[
+                pos : self.gap_start
+            ]
+            self.gap_start, self.gap_end = pos, self.gap_end - count
+        elif pos > self.gap_start:
+            count = pos - self.gap_start
+            self.chars[self.gap_start : pos] = self.chars[
+                self.gap_end : self.gap_end + count
+            ]
+            self.gap_start, self.gap_end = pos, self.gap_end + count
+
+    def move(self, offset):
+        self.move_to(self.cursor + offset)
+
+    ######## EDITING #########
+    # double the capacity until the gap holds needed characters
+    def grow(self, needed):
+        gap = self.gap_end - self.gap_start
+        if gap >= needed:
+            return
+        extra = max(needed - gap, len(self.chars))
+        self.chars[self.gap_end : self.gap_end] = [""] * extra
+        self.gap_end += extra
+
+    # insert text at the cursor, the cursor ends after it
+    def insert(self, text, record=True):
+        if not text:
+            return
+        self.grow(len(text))
+        pos = self.gap_start
+        self.chars[pos : pos + len(text)] = text
+        self.gap_start += len(text)
+        self.mark_changed(pos)
+        if record:
+            self.record(Edit("insert", pos, text))
+
+    # delete count characters before the cursor, returns them
+    def backspace(self, count=1, record=True):
+        count = min(count, self.gap_start)
+        if count <= 0:
+            return ""
+        self.gap_start -= count
+        removed = "".join(self.chars[self.gap_start : self.gap_start + count])
+        self.mark_changed(self.gap_start)
+        if record:
+            self.record(Edit("delete", self.gap_start, removed))
+        return removed
+
+    # delete count characters after the cursor, returns them
+    def delete(self, count=1, record=True):
+        count = min(count, len(self.chars) - self.gap_end)
+        if count <= 0:
+            return ""
+        removed = "".join(self.chars[self.gap_end : self.gap_end + count])
+        self.gap_end += count
+        self.mark_changed(self.gap_start)
+        if record:
+            self.record(Edit("delete", self.gap_start, removed))
+        return removed
+
+    # replace count characters before the cursor with text, as one edit
+    def replace(self, count, text, record=True):
+        removed = self.backspace(count, record=False)
+        self.insert(text, record=False)
+        if record:
+            self.record(Edit("replace", self.cursor - len(text), text, removed))
+        return removed
+
+    ######## WORDS AND LINES #########
+    # start of the word before the cursor (spaces before the cursor included)
+    def word_start(self):
+        pos = self.cursor
+        while pos > 0 and self.char_at(pos - 1).isspace():
+            pos -= 1
+        while pos > 0 and not self.char_at(pos - 1).isspace():
+            pos -= 1
+        return pos
+
+    # end of the word after the cursor (spaces after the cursor included)
+    def word_end(self):
+        pos, length = self.cursor, len(self)
+        while pos < length and self.char_at(pos).isspace():
+            pos += 1
+        while pos < length and not self.char_at(pos).isspace():
+            pos += 1
+        return pos
+
+    def line_start(self):
+        pos = self.cursor
+        while pos > 0 and self.char_at(pos - 1) != "\n":
+            pos -= 1
+        return pos
+
+    def line_end(self):
+        pos, length = self.cursor, len(self)
+        while pos < length and self.char_at(pos) != "\n":
+            pos += 1
+        return pos
+
+    # word before the cursor without its spaces, "" if the cursor is in spaces
+    def current_word(self):
+        pos = self.cursor
+        while pos > 0 and not self.char_at(pos - 1).isspace():
+            pos -= 1
+        return self.slice(pos, self.cursor)
+
+    def move_word(self, direction):
+        self.move_to(self.word_end() if direction > 0 else self.word_start())
+
+    def delete_word(self):
+        return self.backspace(self.cursor - self.word_start())
+
+    def delete_line(self):
+        return self.backspace(self.cursor - self.line_start())
+
+    ######## UNDO #########
+    # typing merges into the last edit, so undo removes a word at a time
+    def record(self, edit):
+        if self.undo_ring:
+            last = self.undo_ring[-1]
+            if (
+                edit.kind == last.kind == "insert"
+                and edit.pos == last.pos + len(last.text)
+                and not edit.text.isspace()
+                and not last.text[-1].isspace()
+            ):
+                self.undo_ring[-1] = Edit("insert", last.pos, last.text + edit.text)
+                return
+        self.undo_ring.append(edit)
+
+    # revert the last edit, False if there is none left
+    def undo(self):
+        if not self.undo_ring:
+            return False
+
+        edit = self.undo_ring.pop()
+        if edit.kind == "insert":
+            self.move_to(edit.pos)
+            self.delete(len(edit.text), record=False)
+        elif edit.kind == "replace":
+            self.move_to(edit.pos + len(edit.text))
+            self.replace(len(edit.text), edit.removed, record=False)
+        else:
+            self.move_to(edit.pos)
+            self.insert(edit.text, record=False)
+        return True
+
+
+class TextView:
+    # lays out a GapBuffer in rows of at most cols characters, broken after
+    # spaces (or within words longer than a row) and at newlines
+    # rows are kept as start positions and laid out again only from the row of
+    # the first edit, visible() returns the rows rows up to the cursor
+    def __init__(self, buffer, cols=40, rows=3):
+        self.buffer = buffer
+        self.cols = cols
+        self.rows = rows
+        self.row_starts = [0]
+        self.layout_from(0)
+
+    # change the row size, everything is laid out again
+    def resize(self, cols, rows):
+        if (cols, rows) == (self.cols, self.rows):
+            return
+        self.cols = max(cols, 1)
+        self.rows = rows
+        self.row_starts = [0]
+        self.layout_from(0)
+
+    # lay out rows again after the buffer changed
+    def update(self):
+        changed_from = self.buffer.take_changes()
+        if changed_from is None:
+            return
+
+        # a shorter row may now take the first word of the next one,
+        # so the row before the edit is laid out again too
+        row = max(bisect_right(self.row_starts, changed_from) - 2, 0)
+        del self.row_starts[row + 1 :]
+        self.layout_from(row)
+
+    # lay out all rows from the start of row
+    def layout_from(self, row):
+        buffer, cols = self.buffer, self.cols
+        length = len(buffer)
+        start = self.row_starts[row]
+        while True:
+            text = buffer.slice(start, min(start + cols + 1, length))
+            newline = text.find("\n", 0, cols)
+            if newline >= 0:
+                end = start + newline + 1
+            elif start + cols >= length:
+                break
+            else:
+                space = text.rfind(" ")
+                end = start + space + 1 if space > 0 else start + cols
+            self.row_starts.append(end)
+            start = end
+
+    # text of the visible rows, the last one holds the cursor
+    def visible(self):
+        cursor = self.buffer.cursor
+        last = bisect_right(self.row_starts, cursor) - 1
+        first = max(last - self.rows + 1, 0)
+        ends = self.row_starts[first + 1 : last + 1] + [self.row_end(last)]
+        return tuple(
+            self.buffer.slice(start, end).rstrip("\n")
+            for start, end in zip(self.row_starts[first : last + 1], ends)
+        )
+
+    def row_end(self, row):
+        if row + 1 < len(self.row_starts):
+            return self.row_starts[row + 1]
+        return len(self.buffer)
@@ -2,25 +2,121 @@ import cv2
 import time
 import numpy as np
 import mediapipe as mp
+from collections import namedtuple
 
+from events import KeyEventBus
 from keyboard import Keyboard
 from hands import Hands
-from landmarker import HandLandmarker
+from landmarker import HandLandmarker, LandmarkerConfig
+from landmark_trace import TraceRecorder
+from landmarks import mirror_hands, result_arrays
+from pacing import FrameScheduler, TimestampSource
+from pipeline import (
+    FrameRing,
+    InFlight,
+    InferenceTracker,
+    LatestQueue,
+    SnapshotSlot,
+    StageThread,
+)
+
+# everything the renderer needs for one frame, published by the landmarker callback
+FrameSnapshot = namedtuple("FrameSnapshot", ["image", "timestamp", "hands", "keyboard"])
 
 
 class App:
-    def __init__(self):
-        self.FPS = 10
-        self.window_width = 1280
-        self.window_height = 720
+    def __init__(
+        self,
+        window_width=1280,
+        window_height=720,
+        fps=30,
+        low_power=False,
+        record_path=None,
+        debug=True,
+        smoothing=None,
+        inference_roi=None,
+        landmarker_config=None,
+        max_in_flight=1,
+        mirror_in_coordinates=False,
+    ):
+        # target inference rate (None = uncapped)
+        # low power drops to 2 fps while no hands are on screen
+        self.scheduler = FrameScheduler(fps, idle_fps=2 if low_power else None)
+        self.poll_interval = 0.1  # max seconds a stage blocks waiting for input
+
+        # detect_async rejects timestamps that do not increase
+        self.timestamps = TimestampSource()
+
+        # frames given to the landmarker and not answered yet, at most
+        # max_in_flight: a busy landmarker gets the latest frame once it is free
+        # each result is paired with its frame, capture -> result and
+        # capture -> keystroke latencies are part of the pipeline stats
+        self.inference = InferenceTracker(max_in_flight)
+
+        # requested capture size, the camera may deliver another one
+        self.window_width = window_width
+        self.window_height = window_height
 
-        self.raw_img = None
         self.annotated_img = None
 
-        self.landmarker = HandLandmarker(self.print_result).landmarker
+        # frame buffers reused across frames, drawing happens in place
+        # mp.Image copies the pixels it gets, so capture buffers are free again
+        # once submitted; capture ring covers the one being read, the queued one
+        # and the one the inference stage is still flipping, cropping or
+        # wrapping in mp.Image after taking it from the queue
+        self.capture_ring = FrameRing(4)
+        self.flip_ring = FrameRing(1)
+        self.render_ring = FrameRing(2)
+        self.frame_shape = None
+
+        # mirror landmarks instead of flipping pixels before inference,
+        # the frame is then flipped once while copied out for display
+        self.mirror_in_coordinates = mirror_in_coordinates
+
+        # record landmarker results for replay (see landmark_trace.py)
+        self.record_path = record_path
+        self.recorder = TraceRecorder() if record_path else None
+
+        # temporal landmark filter (see smoothing.py), e.g. make_smoother("kalman")
+        # applied after recording, so traces keep the raw landmarks
+        self.smoother = smoothing
+
+        # run the landmarker only on a region around keyboard and hands
+        # (see roi.py), e.g. InferenceRoi(); full frames are kept for rendering
+        # in roi_ring until their result arrives, it also covers the snapshot
+        # published, the one drawn and the one being copied
+        self.inference_roi = inference_roi
+        self.roi_ring = FrameRing(max_in_flight + 3)
+
+        # capture -> inference -> render pipeline
+        # queues hold only the latest frames, older ones are dropped
+        self.capture = None
+        self.capture_queue = LatestQueue("capture")
+        self.result_slot = SnapshotSlot("result")
+        self.stages = []
+        self.stats_interval = 5  # seconds between pipeline reports
+
+        # model, hand count and confidences (see landmarker.py), results of the
+        # live camera always arrive through the print_result callback
+        landmarker_config = landmarker_config or LandmarkerConfig()
+        self.landmarker = HandLandmarker(
+            self.print_result, landmarker_config._replace(running_mode="live_stream")
+        ).landmarker
         self.keyboard = Keyboard()
         self.hands = Hands()
 
+        # landmark coordinate overlays, toggled at runtime with "d"
+        self.hands.hud.enabled = debug
+
+        # typed keys are published as events (see events.py) instead of being
+        # typed on the landmarker thread, the keyboard text is one subscriber,
+        # add more with key_events.subscribe(name, handler)
+        self.key_events = KeyEventBus()
+        self.hands.key_events = self.key_events
+        self.key_events.subscribe(
+            "keyboard", lambda event: self.keyboard.type_key(event.key)
+        )
+
     def print_result(
         self,
         result: mp.tasks.vision.HandLandmarkerResult,
@@ -29,60 +125,218 @@ class App:
     ):
         # print("landmarker result activated")
         try:
-            self.raw_img = output_image.numpy_view()
-            self.hands.process_results(result, timestamp_ms, self.keyboard)
+            # frame the result belongs to, None if it was given up on
+            entry = self.inference.complete(timestamp_ms)
+            if entry is None:
+                return
+
+            # converted to arrays once, everything downstream slices them
+            # output_image is the frame submitted, or its crop
+            detection = result_arrays(result)
+            image = output_image.numpy_view()
+            if self.inference_roi is not None:
+                detection, image = self.roi_to_frame(detection, entry)
+            self.scheduler.report_activity(len(detection.handedness) > 0)
+
+            if self.mirror_in_coordinates:
+                detection = mirror_hands(detection)
+
+            if self.recorder is not None:
+                self.recorder.record(detection, timestamp_ms)
+
+            if self.smoother is not None:
+                detection = self.smoother(detection, timestamp_ms)
+
+            keystrokes = self.hands.keystrokes
+            self.hands.process_results(detection, timestamp_ms, self.keyboard)
+            if self.hands.keystrokes != keystrokes:
+                self.inference.keystroke(entry)
+
+            # hand over an immutable copy, the renderer never reads live state
+            snapshot = FrameSnapshot(
+                image,
+                timestamp_ms,
+                self.hands.snapshot(),
+                self.keyboard.snapshot(),
+            )
+            self.result_slot.publish(snapshot)
 
         except Exception as e:
             print(e)
 
-    def process_img(self):
-        img = np.copy(self.raw_img)
+    def process_img(self, snapshot):
+        # the only full-frame copy on the render path, result image is read-only
+        img = self.render_ring.next(snapshot.image.shape)
+        if self.mirror_in_coordinates:
+            cv2.flip(snapshot.image, 1, dst=img)
+        else:
+            np.copyto(img, snapshot.image)
         
-        # draw stuff
-        keyboard_img = self.keyboard.draw_keyboard_on_img(img)
-        annotated_img = self.hands.draw_landmarks_on_image(keyboard_img)
+        # draw stuff (in place)
+        self.keyboard.draw_keyboard_on_img(img, snapshot.keyboard)
+        self.hands.draw_landmarks_on_image(img, snapshot.hands)
 
-        # draw finger landmark coordiates (for development use only)
-        annotated_img = self.hands.draw_fingertips(annotated_img)
+        # draw finger landmark coordiates (for development use only, "d" toggles)
+        self.hands.draw_fingertips(img, snapshot.hands)
 
-        self.annotated_img = annotated_img
+        self.annotated_img = img
 
-    def run(self):
-        capture = cv2.VideoCapture(0)
-        capture.set(3, self.window_width)
-        capture.set(4, self.window_height)
+    # capture stage: read frames from camera as fast as it delivers them
+    def capture_step(self):
+        # read into a preallocated buffer once the frame shape is known
+        buffer = None
+        if self.frame_shape is not None:
+            buffer = self.capture_ring.next(self.frame_shape)
 
-        while True:
-            ret, opencv_image = capture.read()
-            # print("image read")
+        ret, opencv_image = self.capture.read(buffer)
+        captured = time.perf_counter()
+        if not ret:
+            # camera not ready, avoid spinning
+            time.sleep(self.poll_interval)
+            return False
+
+        self.frame_shape = opencv_image.shape
+        self.capture_queue.put((opencv_image, captured))
+        return True
 
-            if ret:
-                opencv_image = cv2.flip(opencv_image, 1)
+    # inference stage: submit latest captured frame to the landmarker
+    # paced by the scheduler, so inference runs at most at the target fps,
+    # and by the landmarker, which gets no new frame while it has max_in_flight
+    def inference_step(self):
+        self.scheduler.wait()
+        if not self.inference.wait_slot(timeout=self.poll_interval):
+            return False
 
-                mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=opencv_image)
+        captured_frame = self.capture_queue.get(timeout=self.poll_interval)
+        if captured_frame is None:
+            return False
+        opencv_image, captured = captured_frame
 
+        if not self.mirror_in_coordinates:
+            flipped = self.flip_ring.next(opencv_image.shape)
+            opencv_image = cv2.flip(opencv_image, 1, dst=flipped)
+
+        # fit keyboard to the frame size actually delivered
+        height, width = opencv_image.shape[:2]
+        self.keyboard.set_frame_size(width, height)
+
+        timestamp = self.timestamps.next()
+        full_frame, rect = None, None
+        if self.inference_roi is not None:
+            full_frame, rect = self.roi_frame(opencv_image)
+            opencv_image = self.inference_roi.crop(opencv_image, rect)
+
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=opencv_image)
+
+        entry = InFlight(timestamp, full_frame, captured, time.perf_counter(), rect)
+        self.inference.submit(entry)
+        try:
+            self.landmarker.detect_async(mp_image, timestamp)
+        except Exception as e:
+            self.inference.reject(timestamp)
+            print("detect async exception", e)
+            return False
+
+        return True
+
+    # copy of frame kept for rendering and the roi the landmarker gets of it
+    def roi_frame(self, frame):
+        height, width = frame.shape[:2]
+        rect = self.inference_roi.rect(
+            (width, height),
+            self.keyboard.layout.bbox,
+            self.hands.detection,
+            self.mirror_in_coordinates,
+        )
+
+        full_frame = self.roi_ring.next(frame.shape)
+        np.copyto(full_frame, frame)
+        return full_frame, rect
+
+    # map a result on a roi back to the full frame of entry
+    # returns (detection, frame)
+    def roi_to_frame(self, detection, entry):
+        height, width = entry.frame.shape[:2]
+        detection = self.inference_roi.to_frame(detection, entry.data, (width, height))
+        return detection, entry.frame
+
+    # per-stage queue depth, dropped frames and processed counts
+    def pipeline_stats(self):
+        stats = {}
+        for queue in (self.capture_queue, self.result_slot):
+            stats[queue.name + "_queue"] = queue.stats()
+        for stage in self.stages:
+            stats[stage.name] = stage.stats()
+        stats["scheduler"] = self.scheduler.stats()
+        stats["landmarker"] = self.landmarker_stats()
+        stats["key_events"] = self.key_events.stats()
+        if self.inference_roi is not None:
+            stats["roi"] = self.inference_roi.stats()
+        return stats
+
+    # submissions, results and latencies of the landmarker
+    def landmarker_stats(self):
+        stats = self.inference.stats()
+        stats["timestamps"] = self.timestamps.stats()
+        return stats
+
+    def print_pipeline_stats(self):
+        stats = self.pipeline_stats()
+        print(" | ".join(f"{name} {values}" for name, values in stats.items()))
+
+    def run(self):
+        self.capture = cv2.VideoCapture(0)
+        self.capture.set(3, self.window_width)
+        self.capture.set(4, self.window_height)
+
+        self.stages = [
+            StageThread("capture", self.capture_step),
+            StageThread("inference", self.inference_step),
+        ]
+        for stage in self.stages:
+            stage.start()
+
+        # render stage runs on main thread (opencv windows require it)
+        last_report = time.time()
+        while True:
+            # wait for a new result, but keep the window responsive
+            snapshot = self.result_slot.take(timeout=self.poll_interval)
+
+            if snapshot is not None:
+                # process the raw image
                 try:
-                    timestamp = int(time.time() * 1000)
-                    self.landmarker.detect_async(mp_image, timestamp)
+                    self.process_img(snapshot)
+                    # display annotated image
+                    cv2.imshow("annotated", self.annotated_img)
                 except Exception as e:
-                    print("detect async exception", e)
-
-                if self.raw_img is not None:
-                    # process the raw image
-                    try:
-                        self.process_img()
-                        # display annotated image
-                        cv2.imshow("annotated", self.annotated_img)
-                    except Exception as e:
-                        print(e)
-
-            # wait for escape key
-            if cv2.waitKey(1000 // self.FPS) == 27:
+                    print(e)
+
+            if time.time() - last_report >= self.stats_interval:
+                self.print_pipeline_stats()
+                last_report = time.time()
+
+            # wait for escape key, tab switches keyboard layout
+            key = cv2.waitKey(1)
+            if key == 27:
                 break
+            elif key == 9:
+                self.keyboard.next_layout()
+            elif key == ord("d"):
+                self.hands.hud.toggle()
 
-        capture.release()
+        for stage in self.stages:
+            stage.stop()
+        for stage in self.stages:
+            stage.join()
+        self.key_events.stop()
+
+        self.capture.release()
         cv2.destroyAllWindows()
 
+        if self.recorder is not None:
+            self.recorder.save(self.record_path)
+            print(f"recorded {len(self.recorder)} frames to {self.record_path}")
+
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from hands import Hands
+from keyboard import Keyboard
+from landmarker import DELEGATES, HandLandmarker, LandmarkerConfig
+from landmarks import empty_hands, result_arrays
+from roi import InferenceRoi
+from smoothing import FILTERS, make_smoother
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+# frames of a video file or of the images in a directory (sorted by name)
+def iter_frames(source):
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, filename))
+                if frame is not None:
+                    yield frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    try:
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+# frame rate of a video source, None for image directories or unknown rate
+def source_fps(source):
+    if os.path.isdir(source):
+        return None
+
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps if fps > 0 else None
+
+
+# count, mean and percentiles in milliseconds of a list of durations in seconds
+def summarize(durations):
+    ms = np.asarray(durations, dtype=np.float64) * 1000
+    if len(ms) == 0:
+        return {"count": 0}
+
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "total_ms": round(float(ms.sum()), 3),
+    }
+
+
+class StageTimer:
+    # collects per-frame durations of named pipeline stages
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, name, seconds):
+        self.durations.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def summary(self):
+        return {name: summarize(values) for name, values in self.durations.items()}
+
+
+class TimedKeyboard:
+    # forwards everything to keyboard, adding up time spent in hit tests
+    # so they can be reported apart from the rest of the finger update
+    def __init__(self, keyboard):
+        self.keyboard = keyboard
+        self.elapsed = 0.0
+
+    def query_key_id(self, x_norm, y_norm):
+        start = time.perf_counter()
+        key = self.keyboard.query_key_id(x_norm, y_norm)
+        self.elapsed += time.perf_counter() - start
+        return key
+
+    def query_key_ids(self, points_norm, layout=None):
+        start = time.perf_counter()
+        key_ids = self.keyboard.query_key_ids(points_norm, layout)
+        self.elapsed += time.perf_counter() - start
+        return key_ids
+
+    def __getattr__(self, name):
+        return getattr(self.keyboard, name)
+
+
+# run the full landmarker -> hands -> keyboard pipeline on a recorded source
+# synchronously, in VIDEO mode (or IMAGE mode, frames detected independently)
+# with timestamps derived from the frame index
+# landmarker_config: landmarker.LandmarkerConfig, LIVE_STREAM mode runs as VIDEO
+# smoothing names a smoothing.FILTERS kind to filter landmarks with
+# roi runs inference on the region around keyboard and hands only (roi.py)
+def run_benchmark(
+    source,
+    fps=30,
+    max_frames=None,
+    draw=True,
+    smoothing=None,
+    roi=False,
+    landmarker_config=None,
+):
+    fps = source_fps(source) or fps
+
+    keyboard = Keyboard()
+    hands = Hands()
+    landmarker_config = landmarker_config or LandmarkerConfig(running_mode="video")
+    running_mode = landmarker_config.running_mode
+    if getattr(running_mode, "value", running_mode).lower() == "live_stream":
+        landmarker_config = landmarker_config._replace(running_mode="video")
+    landmarker = HandLandmarker(config=landmarker_config)
+    timed_keyboard = TimedKeyboard(keyboard)
+    smoother = make_smoother(smoothing) if smoothing else None
+    inference_roi = InferenceRoi() if roi else None
+    detection = empty_hands()
+
+    timer = StageTimer()
+    latencies = []
+    frames = iter_frames(source)
+    img = None
+
+    start = time.perf_counter()
+    while max_frames is None or len(latencies) < max_frames:
+        frame_start = time.perf_counter()
+        frame = next(frames, None)
+        if frame is None:
+            break
+        frame = cv2.flip(frame, 1)
+        timer.add("capture", time.perf_counter() - frame_start)
+
+        height, width = frame.shape[:2]
+        keyboard.set_frame_size(width, height)
+        timestamp = int(len(latencies) * 1000 / fps)
+
+        image = frame
+        if inference_roi is not None:
+            with timer.stage("roi"):
+                rect = inference_roi.rect(
+                    (width, height), keyboard.layout.bbox, detection
+                )
+                image = inference_roi.crop(frame, rect)
+
+        with timer.stage("inference"):
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+            result = landmarker.detect(mp_image, timestamp)
+
+        with timer.stage("convert"):
+            detection = result_arrays(result)
+            if inference_roi is not None:
+                detection = inference_roi.to_frame(detection, rect, (width, height))
+
+        if smoother is not None:
+            with timer.stage("smoothing"):
+                detection = smoother(detection, timestamp)
+
+        # finger update excludes the hit tests it triggers
+        timed_keyboard.elapsed = 0.0
+        update_start = time.perf_counter()
+        hands.process_results(detection, timestamp, timed_keyboard)
+        update_time = time.perf_counter() - update_start
+        timer.add("hit_test", timed_keyboard.elapsed)
+        timer.add("finger_update", update_time - timed_keyboard.elapsed)
+
+        if draw:
+            with timer.stage("snapshot"):
+                hands_state = hands.snapshot()
+                keyboard_state = keyboard.snapshot()
+
+            with timer.stage("draw_copy"):
+                if img is None or img.shape != frame.shape:
+                    img = np.empty_like(frame)
+                np.copyto(img, frame)
+
+            with timer.stage("draw_keyboard"):
+                keyboard.draw_keyboard_on_img(img, keyboard_state)
+
+            with timer.stage("draw_landmarks"):
+                hands.draw_landmarks_on_image(img, hands_state)
+
+            with timer.stage("draw_fingertips"):
+                hands.draw_fingertips(img, hands_state)
+
+        latencies.append(time.perf_counter() - frame_start)
+
+    total = time.perf_counter() - start
+    landmarker.close()
+
+    report = {
+        "source": source,
+        "landmarker": landmarker_config._asdict(),
+        "frames": len(latencies),
+        "fps": round(len(latencies) / total, 2) if total > 0 else 0.0,
+        "latency": summarize(latencies),
+        "stages": timer.summary(),
+    }
+    if inference_roi is not None:
+        report["roi"] = inference_roi.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless benchmark of the typing pipeline on a recorded source"
+    )
+    parser.add_argument("source", help="video file or directory of images")
+    parser.add_argument(
+        "--fps", type=float, default=30, help="timestamp rate if source has none"
+    )
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--no-draw", action="store_true", help="skip drawing steps")
+    parser.add_argument(
+        "--smoothing", choices=sorted(FILTERS), help="filter landmarks before use"
+    )
+    parser.add_argument(
+        "--roi", action="store_true", help="infer on keyboard and hand region only"
+    )
+
+    landmarker_args = parser.add_argument_group("landmarker")
+    defaults = LandmarkerConfig()
+    landmarker_args.add_argument("--model", default=defaults.model_path)
+    landmarker_args.add_argument("--num-hands", type=int, default=defaults.num_hands)
+    landmarker_args.add_argument(
+        "--min-detection", type=float, default=defaults.min_detection_confidence
+    )
+    landmarker_args.add_argument(
+        "--min-presence", type=float, default=defaults.min_presence_confidence
+    )
+    landmarker_args.add_argument(
+        "--min-tracking", type=float, default=defaults.min_tracking_confidence
+    )
+    landmarker_args.add_argument(
+        "--running-mode", choices=("video", "image"), default="video"
+    )
+    landmarker_args.add_argument("--delegate", choices=DELEGATES)
+    parser.add_argument("--output", help="write json report to file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.source,
+        fps=args.fps,
+        max_frames=args.max_frames,
+        draw=not args.no_draw,
+        smoothing=args.smoothing,
+        roi=args.roi,
+        landmarker_config=LandmarkerConfig(
+            model_path=args.model,
+            num_hands=args.num_hands,
+            min_detection_confidence=args.min_detection,
+            min_presence_confidence=args.min_presence,
+            min_tracking_confidence=args.min_tracking,
+            running_mode=args.running_mode,
+            delegate=args.delegate,
+        ),
+    )
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+# a key typed by a finger
+#   key: key name, finger: finger index (0-9, left thumb to right pinky)
+#   hand: handedness name, confidence: handedness score of the hand
+#   timestamp: landmarker timestamp (ms) of the frame it was typed in
+#   created: time.perf_counter() when it was typed
+KeyEvent = namedtuple(
+    "KeyEvent", ["key", "finger", "hand", "confidence", "timestamp", "created"]
+)
+
+
+class Subscriber(threading.Thread):
+    # consumes key events on its own thread, handler(event) is called in order
+    # events wait in a bounded deque, when a slow handler lets it fill up the
+    # oldest events are dropped, so publishing never waits for the handler
+    def __init__(self, name, handler, maxsize=256, poll_interval=0.1):
+        super().__init__(name=name, daemon=True)
+        self.handler = handler
+        self.events = deque(maxlen=maxsize)
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.poll_interval = poll_interval
+
+        # statistics
+        self.received = 0
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lag = 0.0  # seconds from publish to handling of the last event
+        self.max_lag = 0.0
+
+    # called from the publishing thread, never blocks
+    def put(self, event):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append(event)
+        self.received += 1
+        self.wake_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.wake_event.wait(self.poll_interval)
+            self.wake_event.clear()
+            self.drain()
+        self.drain()
+
+    def drain(self):
+        while self.events:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                return
+
+            try:
+                self.handler(event)
+            except Exception as e:
+                self.errors += 1
+                print(f"{self.name} exception", e)
+            self.handled += 1
+            self.lag = time.perf_counter() - event.created
+            self.max_lag = max(self.max_lag, self.lag)
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def stats(self):
+        return {
+            "depth": len(self.events),
+            "received": self.received,
+            "handled": self.handled,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "lag_ms": round(self.lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+        }
+
+
+class KeyEventBus:
+    # fans key events out to subscribers, each consuming on its own thread
+    # publish() only appends to the subscriber queues, so the landmarker callback
+    # publishing events never waits for a consumer
+    def __init__(self):
+        self.subscribers = []
+        self.published = 0
+
+    # handler(event) runs on a new thread named name, started right away
+    def subscribe(self, name, handler, maxsize=256):
+        subscriber = Subscriber(name, handler, maxsize)
+        self.subscribers.append(subscriber)
+        subscriber.start()
+        return subscriber
+
+    def publish(self, event):
+        for subscriber in self.subscribers:
+            subscriber.put(event)
+        self.published += 1
+
+    # stop all subscribers after they handled the events already published
+    def stop(self):
+        for subscriber in self.subscribers:
+            subscriber.stop()
+        for subscriber in self.subscribers:
+            subscriber.join()
+
+    def stats(self):
+        stats = {"published": self.published}
+        for subscriber in self.subscribers:
+            stats[subscriber.name] = subscriber.stats()
+        return stats
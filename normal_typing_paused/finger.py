@@ -1,107 +1,69 @@
 import numpy as np
+from collections import namedtuple
+
+# immutable copy of finger state, safe to read from the render thread
+FingerState = namedtuple(
+    "FingerState",
+    ["name", "handedness", "on_key", "keydown", "on_screen", "tip_wcoor", "tip_ncoor"],
+)
 
 
 class Finger:
-    def __init__(self, name, name_id, handedness):
-        self.KEYDOWN_DISTANCE_THRESHOLD = 0.8  # arbitrary threshold
-        self.KEYUP_DISTANCE_THRESHOLD = 0.4  # arbitrary threshold
-        
+    # view of one row of the finger state arrays kept by Hands
+    # state is updated for all 10 fingers at once in Hands.update_finger
+    def __init__(self, hands, finger_id, name, name_id, handedness):
+        self.hands = hands
+        self.finger_id = finger_id      # 0-9, row in the state arrays
+
         # identify finger
         self.name = name                # THUMB/INDEX/MIDDLE/RING/PINKY
         self.name_id = name_id          # 0-4
         self.handedness = handedness    # Left or Right
 
-        # on key
-        self.on_key_name = -1           # which key fingertip is on (Q-M)
-        self.on_key = -1                # which key name
-        # self.prev_key_id = -1           # on which key in prev frame
-        
-        # state
-        self.keydown = False                # if keydown
-        self.on_screen = False              # present on screen?
-        
-        # position related
-        self.tip_wcoor = None                 # current tip position (world coor)
-        self.tip_ncoor = None                 # current tip pos (normalized coor)
-        
-        self.anchor_tip_wcoor = None          # anchor tip pos (for keyup/down detection)
-        # anchor tip is the tip used for comparing with current tip position (e.g. peak/bottom values)
-        
-        # normalized coordinates -> related to screen
-        # FUTURE: pos of other parts too
-    
-    # update finger present on screen
-    def update_present(self, wlandmark, nlandmark, keyboard):
-        # update fingertip coordinates
-        self.tip_wcoor = [wlandmark.x, wlandmark.y, wlandmark.z * 100]
-        self.tip_ncoor = [nlandmark.x, nlandmark.y, nlandmark.z]
-        
-        # query currently lies on which key
-        cur_key = keyboard.query_key_id(self.tip_ncoor[0], self.tip_ncoor[1])
+    # which key name fingertip is on, -1 if none
+    @property
+    def on_key(self):
+        return self.hands.key_name(self.hands.on_key[self.finger_id])
+
+    # if keydown
+    @property
+    def keydown(self):
+        return bool(self.hands.keydown[self.finger_id])
+
+    # present on screen?
+    @property
+    def on_screen(self):
+        return bool(self.hands.on_screen[self.finger_id])
 
-        # check for potential keydown
-        possible_keydown = False
-        displacement = 0
-        
-        # originally not existing
-        if not self.on_screen:
-            self.anchor_tip_wcoor = self.tip_wcoor 
-            self.keydown = False
-            self.on_screen = True
-        
-        # originally down
-        elif self.on_screen and self.keydown:
-            # keyup motion detected
-            if self.tip_wcoor[2] - self.anchor_tip_wcoor[2] > self.KEYUP_DISTANCE_THRESHOLD:
-                self.keydown = False
-                self.anchor_tip_wcoor[2] = self.tip_wcoor[2]
-                
-            # slowly up / still dropping
-            else:
-                # mark lowest point in key press as anchor
-                self.anchor_tip_wcoor[2] = min (
-                     self.anchor_tip_wcoor[2],
-                     self.tip_wcoor[2]
-                )
-        
-        # originally up
-        elif self.on_screen and not self.keydown:
-            # on the way of key down
-            # may add threshold on down coordinates here too
-            if cur_key == self.on_key \
-            and self.on_key != -1 and cur_key != -1 \
-            and self.anchor_tip_wcoor[2] > self.tip_wcoor[2]:
-                # pass threshold
-                if self.anchor_tip_wcoor[2] - self.tip_wcoor[2] > self.KEYDOWN_DISTANCE_THRESHOLD:
-                    # push to keydown candidate
-                    possible_keydown = True
-                    displacement = self.anchor_tip_wcoor[2] - self.tip_wcoor[2]
-                    # print(f"potential keydown {self.name} on {cur_key}")
-                    
-                    self.anchor_tip_wcoor[2] = self.tip_wcoor[2]
+    # current tip position (world coor), None before first seen
+    @property
+    def tip_wcoor(self):
+        if not self.hands.seen[self.finger_id]:
+            return None
+        return self.hands.tip_wcoor[self.finger_id]
 
-                # on the way down, anchor unchanged (peak pos)
-                else:
-                    # print("on the way down")
-                    pass 
-            # maintaining keyup
-            else:
-                # print("maintaining keyup")
-                self.anchor_tip_wcoor[2] = self.tip_wcoor[2]
+    # current tip pos (normalized coor), None before first seen
+    @property
+    def tip_ncoor(self):
+        if not self.hands.seen[self.finger_id]:
+            return None
+        return self.hands.tip_ncoor[self.finger_id]
 
-        # update key id
-        # print("updating key id")
-        self.on_key = cur_key
-        
-        return possible_keydown, displacement
-    
+    # anchor tip z (for keyup/down detection)
+    @property
+    def anchor_z(self):
+        return self.hands.anchor_z[self.finger_id]
 
-    # update finger out of screen
-    def update_absent(self):
-        self.on_screen = 0
-        self.on_key = -1
-        
-    def set_keydown(self):
-        # print(f"set finger {self.name} to keydown on {self.on_key}")
-        self.keydown = True
-        return self.on_key
\ No newline at end of file
+    # copy of current state for rendering
+    def state(self):
+        tip_wcoor = self.tip_wcoor
+        tip_ncoor = self.tip_ncoor
+        return FingerState(
+            self.name,
+            self.handedness,
+            self.on_key,
+            self.keydown,
+            self.on_screen,
+            None if tip_wcoor is None else tuple(tip_wcoor.tolist()),
+            None if tip_ncoor is None else tuple(tip_ncoor.tolist()),
+        )
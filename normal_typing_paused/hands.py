@@ -1,27 +1,75 @@
 import cv2
+import time
 import numpy as np
-from mediapipe.framework.formats import landmark_pb2
-from mediapipe import solutions
 
-from typing import Mapping, Tuple
-from mediapipe.python.solutions.drawing_utils import DrawingSpec
-from mediapipe.python.solutions import hands_connections
+from collections import namedtuple
 
+from events import KeyEvent
 from finger import Finger
+from hud import Hud, TextFont
+from landmarks import HANDEDNESS_NAMES, empty_hands
 
 BLUE = (249, 209, 101)
 WHITE = (255, 255, 255)
+LIGHT_GRAY = (224, 224, 224)
+
+NUM_FINGERS = 10
+FINGERS_PER_HAND = 5
+TIP_LANDMARK_IDS = [4, 8, 12, 16, 20]  # thumb to pinky
+# finger rows of the state arrays grouped per hand, indexed by handedness
+HAND_SHAPE = (len(HANDEDNESS_NAMES), FINGERS_PER_HAND)
+
+# landmark pairs joined in the hand skeleton, same as mediapipe HAND_CONNECTIONS
+HAND_CONNECTIONS = np.array(
+    [
+        (0, 1), (1, 2), (2, 3), (3, 4),  # thumb
+        (0, 5), (5, 6), (6, 7), (7, 8),  # index
+        (5, 9), (9, 10), (10, 11), (11, 12),  # middle
+        (9, 13), (13, 14), (14, 15), (15, 16),  # ring
+        (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),  # pinky
+    ],
+    dtype=np.intp,
+)
+
+# immutable copy of hand state, safe to read from the render thread
+# detection arrays are never mutated after conversion, so they are shared
+HandsSnapshot = namedtuple(
+    "HandsSnapshot",
+    [
+        "detection",
+        "fingers",
+    ],
+)
 
 
 class Hands:
     def __init__(self):
         self.KEYDOWN_CANDIDATE_THRESHOLD = 3  # max #finger to count keydown
-
-        # detection results
-        self.handedness_list = None
-        self.hand_landmarks_list = None
-        self.world_landmarks_list = None
-
+        self.KEYDOWN_DISTANCE_THRESHOLD = 0.8  # arbitrary threshold
+        self.KEYUP_DISTANCE_THRESHOLD = 0.4  # arbitrary threshold
+
+        # detection results (landmarks.HandArrays)
+        self.detection = empty_hands()
+
+        # finger state, one row per finger (left thumb to right pinky)
+        self.tip_wcoor = np.zeros((NUM_FINGERS, 3), dtype=np.float32)  # world coor
+        self.tip_ncoor = np.zeros((NUM_FINGERS, 3), dtype=np.float32)  # normalized
+        self.on_key = np.full(NUM_FINGERS, -1, dtype=np.int32)  # index in key_names
+        self.on_screen = np.zeros(NUM_FINGERS, dtype=bool)
+        self.keydown = np.zeros(NUM_FINGERS, dtype=bool)
+        self.seen = np.zeros(NUM_FINGERS, dtype=bool)  # tip coordinates valid
+        self.key_names = []  # key names of the layout on_key refers to
+        self.layout = None  # layout on_key refers to
+        self.keystrokes = 0  # keys typed so far
+        # events.KeyEventBus typed keys are published to, None types them
+        # straight into the keyboard on the landmarker thread
+        self.key_events = None
+
+        # anchor tip z is compared with current tip z for keyup/down detection
+        # (e.g. peak/bottom values)
+        self.anchor_z = np.zeros(NUM_FINGERS, dtype=np.float32)
+
+        # finger objects, views of the arrays above
         self.fingers = []
         self.init_fingers()
 
@@ -38,6 +86,19 @@ class Hands:
             "FONT_THICKNESS": 1,
             "TEXT_COLOR": BLUE,
         }
+
+        self.skeleton_format = {
+            "LANDMARK_RADIUS": 5,
+            "LANDMARK_COLOR": BLUE,
+            "BORDER_RADIUS": 6,
+            "BORDER_COLOR": LIGHT_GRAY,
+            "CONNECTION_THICKNESS": 2,
+            "CONNECTION_COLOR": WHITE,
+        }
+
+        # cached text for the debug overlays (draw_fingertips, draw_finger)
+        # set hud.enabled = False to skip them entirely
+        self.hud = Hud()
     
     # create the 10 finger objects
     def init_fingers(self):
@@ -45,238 +106,312 @@ class Hands:
         hands = ["Left", "Right"]
         for hand in hands:
             for finger_id, finger_name in enumerate(finger_names):
-                finger = Finger(finger_name, finger_id, hand)
+                finger = Finger(
+                    self, len(self.fingers), finger_name, finger_id, hand
+                )
                 self.fingers.append(finger)
+
+    # name of key at index of key_names, -1 if none
+    def key_name(self, key_id):
+        return self.key_names[key_id] if key_id != -1 else -1
         
     # interpret and store hand landmark detection result
+    # detection is a result converted by landmarks.result_arrays, None if no hand
     # may add more processing here
-    def process_results(self, detection_result, timestamp, keyboard):
+    def process_results(self, detection, timestamp, keyboard):
         # no hand present
-        if detection_result == None:
-            self.hand_landmarks_list = None
-            self.world_landmarks_list = None
-            self.handedness_list = None
-        else:
-            self.hand_landmarks_list = detection_result.hand_landmarks
-            self.world_landmarks_list = detection_result.hand_world_landmarks
-            self.handedness_list = detection_result.handedness
-
-        # update finger position
-        # self.update_finger_old()
-        
+        if detection is None:
+            detection = empty_hands()
+        self.detection = detection
+
         # update finger
-        self.update_finger(keyboard)
+        pressed = self.update_finger(keyboard)
         # print("result stored in hands")
+
+        # fingers that went down on a key type it
+        for finger_id in pressed:
+            if self.on_key[finger_id] != -1:
+                key = self.key_name(self.on_key[finger_id])
+                self.type_key(key, finger_id, timestamp, keyboard)
+
+        # keys under fingertips are hovered, keys held down are pressed
+        keyboard.set_key_states(self.layout, self.on_key, self.on_key[self.keydown])
     
-    def update_finger_old(self):
-        # mark fingers on screen
-        on_screen = []
-        index_displacement = {"Left" : 0, "Right" : 5}
-        
-        for hand_id, hand in enumerate(self.handedness_list):
-            for i in range(0, 5):                                
-                landmark_id = 4 * (i + 1)
-                landmark = self.world_landmarks_list[hand_id][landmark_id]
-                
-                finger_id = index_displacement[hand[0].category_name] + i
-                on_screen.append(finger_id)
-                self.fingers[finger_id].update_present(landmark)
-        
-        for finger_id in range(10):
-            if finger_id not in on_screen:
-                self.fingers[finger_id].update_absent()
+    # hand a typed key to the key event bus (events.KeyEventBus)
+    def type_key(self, key, finger_id, timestamp, keyboard):
+        self.keystrokes += 1
+        if self.key_events is None:
+            keyboard.type_key(key)
+            return
+
+        finger = self.fingers[finger_id]
+        hand = finger_id // FINGERS_PER_HAND
+        scores = self.detection.handedness_score[self.detection.handedness == hand]
+        confidence = float(scores[0]) if len(scores) else 0.0
+        self.key_events.publish(
+            KeyEvent(
+                key,
+                int(finger_id),
+                finger.handedness,
+                confidence,
+                timestamp,
+                time.perf_counter(),
+            )
+        )
 
+    # update all fingers in one pass over the state arrays
+    # returns ids of the fingers that went down
     def update_finger(self, keyboard):
-        index_displacement = {"Left": 0, "Right": 5}
-        
-        # to identify which fingers absent
-        on_screen_fingers = []
-        
-        # for each hand on screen
-        for hand_id, handedness in enumerate(self.handedness_list):
-            start_id = index_displacement[handedness[0].category_name]
-
-            # if <= 3 keydown, only down the one with greatest dist
-            keydown_candidate = []
-            
-            # for each finger in hand
-            for idx in range(0, 5):
-                finger = start_id + idx
-                on_screen_fingers.append(finger)
-                
-                # retrieve landmark
-                landmark_id = 4 * (idx + 1)
-                wlandmark = self.world_landmarks_list[hand_id][landmark_id]
-                nlandmark = self.hand_landmarks_list[hand_id][landmark_id]
-
-                # print(f"updating finger {self.fingers[finger].name}")
-                keydown, displacement = self.fingers[finger].update_present(wlandmark, nlandmark, keyboard)
-                
-                if keydown:
-                    # print("keydown candidate add")
-                    keydown_candidate.append((finger, displacement))
-
-            # exist keydown candidate & not whole hand move
-            if (
-                keydown_candidate
-                and len(keydown_candidate) <= self.KEYDOWN_CANDIDATE_THRESHOLD
-            ):
-                # print("exist keydown candidate")
-                keydown_finger_id = min(keydown_candidate, key=lambda x: x[1])[0]
-                # print(f"keydown by {keydown_finger_id}")
-                
-                # TODO: finger set keydown
-                keyname = self.fingers[keydown_finger_id].set_keydown()
-                # print(f"{keyname} pressed by {keydown_finger_id}")
-                
-                # TODO: update keyboard
-        
-        # update for all absent fingers     
-        for finger_id in range(10):
-            if finger_id not in on_screen_fingers:
-                self.fingers[finger_id].update_absent()
-
-    def draw_fingertips(self, img):
-        annotated_img = np.copy(img)
+        present = np.zeros(NUM_FINGERS, dtype=bool)
+        wcoor = self.tip_wcoor.copy()  # absent fingers keep last position
+        ncoor = self.tip_ncoor.copy()
+
+        # gather fingertips of each hand on screen
+        detection = self.detection
+        hands = detection.handedness
+        wtips = detection.world_landmarks[:, TIP_LANDMARK_IDS]
+        ntips = detection.landmarks[:, TIP_LANDMARK_IDS]
+        wtips[..., 2] *= 100
+        wcoor.reshape(HAND_SHAPE + (3,))[hands] = wtips
+        ncoor.reshape(HAND_SHAPE + (3,))[hands] = ntips
+        present.reshape(HAND_SHAPE)[hands] = True
+
+        # query which keys the tips lie on
+        layout = self.layout = keyboard.layout
+        cur_key = keyboard.query_key_ids(ncoor[:, :2], layout)
+
+        z = wcoor[:, 2]
+        anchor = self.anchor_z.copy()
+        keydown = self.keydown.copy()
+
+        # originally not existing
+        appeared = present & ~self.on_screen
+        anchor[appeared] = z[appeared]
+        keydown[appeared] = False
+
+        # originally down
+        down = present & self.on_screen & self.keydown
+        # keyup motion detected
+        keyup = down & (z - anchor > self.KEYUP_DISTANCE_THRESHOLD)
+        keydown[keyup] = False
+        anchor[keyup] = z[keyup]
+        # slowly up / still dropping, mark lowest point in key press as anchor
+        holding = down & ~keyup
+        anchor[holding] = np.minimum(anchor[holding], z[holding])
+
+        # originally up
+        up = present & self.on_screen & ~self.keydown
+        # on the way of key down
+        # may add threshold on down coordinates here too
+        pressing = (
+            up
+            & (cur_key == self.on_key)
+            & (self.on_key != -1)
+            & (cur_key != -1)
+            & (anchor > z)
+        )
+        # pass threshold, push to keydown candidate
+        # on the way down below it, anchor unchanged (peak pos)
+        candidate = pressing & (anchor - z > self.KEYDOWN_DISTANCE_THRESHOLD)
+        displacement = np.where(candidate, anchor - z, 0)
+        anchor[candidate] = z[candidate]
+        # maintaining keyup
+        released = up & ~pressing
+        anchor[released] = z[released]
+
+        # exist keydown candidate & not whole hand move
+        # if <= 3 keydown, only down the one with greatest dist
+        hand_keydown = keydown.reshape(HAND_SHAPE)
+        hand_displacement = displacement.reshape(HAND_SHAPE)
+        for hand, hand_candidate in enumerate(candidate.reshape(HAND_SHAPE)):
+            hand_candidates = np.flatnonzero(hand_candidate)
+            if 0 < len(hand_candidates) <= self.KEYDOWN_CANDIDATE_THRESHOLD:
+                keydown_finger = hand_candidates[
+                    np.argmin(hand_displacement[hand, hand_candidates])
+                ]
+                hand_keydown[hand, keydown_finger] = True
+
+        # absent fingers keep keydown and anchor, but are on no key
+        cur_key[~present] = -1
+
+        self.tip_wcoor[:] = wcoor
+        self.tip_ncoor[:] = ncoor
+        self.on_key[:] = cur_key
+        self.on_screen[:] = present
+        pressed = np.flatnonzero(keydown & ~self.keydown)
+        self.keydown[:] = keydown
+        self.anchor_z[:] = anchor
+        self.seen |= present
+        self.key_names = layout.key_names
+
+        return pressed
+
+    # capture current state for rendering
+    def snapshot(self):
+        return HandsSnapshot(
+            self.detection,
+            tuple(finger.state() for finger in self.fingers),
+        )
+
+    # font described by landmark_text_format
+    def landmark_font(self):
+        return TextFont(
+            cv2.FONT_HERSHEY_DUPLEX,
+            self.landmark_text_format["FONT_SIZE"],
+            self.landmark_text_format["FONT_THICKNESS"],
+            cv2.LINE_AA,
+        )
+
+    # draw lines one below the other, first baseline starting at (text_x, text_y)
+    def draw_landmark_text(self, img, text_x, text_y, lines):
+        return self.hud.text(
+            img,
+            (text_x, text_y),
+            lines,
+            self.landmark_font(),
+            self.landmark_text_format["TEXT_COLOR"],
+        )
+
+    def draw_fingertips(self, img, state=None):
+        if not self.hud.enabled:
+            return img
+        if state is None:
+            state = self.snapshot()
+
+        annotated_img = img  # annotated in place
 
         text_start_pos = {"Left": 20, "Right": 400}
-        finger_displacement = {"Left": 0, "Right": 5}
+        detection = state.detection
 
-        for hand_id, hand in enumerate(self.handedness_list):
-            text_x = text_start_pos[hand[0].category_name]
+        for hand_id, hand in enumerate(detection.handedness):
+            hand_name = HANDEDNESS_NAMES[hand]
+            text_x = text_start_pos[hand_name]
             text_y = 40
 
-            for finger in range(5):
-                finger_id = finger + finger_displacement[hand[0].category_name]
-                landmark_id = 4 * (finger + 1)
-                # landmark = self.world_landmarks_list[hand_id][landmark_id]
-                landmark = self.hand_landmarks_list[hand_id][landmark_id]
-
-                x, y, z = landmark.x, landmark.y, landmark.z
-                text = f"{finger+1} ({self.fingers[finger_id].keydown}): x {x*100:.1f}; y {y*100:.1f}; z {z*100:.1f}"
-
-                cv2.putText(
-                    annotated_img,
-                    text,
-                    (text_x, text_y),
-                    cv2.FONT_HERSHEY_DUPLEX,
-                    self.landmark_text_format["FONT_SIZE"],
-                    self.landmark_text_format["TEXT_COLOR"],
-                    self.landmark_text_format["FONT_THICKNESS"],
-                    cv2.LINE_AA,
-                )
-                text_y += 15
+            # tips of this hand, as percentages
+            tips = detection.landmarks[hand_id, TIP_LANDMARK_IDS] * 100
+
+            lines = []
+            for finger, (x, y, z) in enumerate(tips.tolist()):
+                finger_id = finger + hand * FINGERS_PER_HAND
+                text = f"{finger+1} ({state.fingers[finger_id].keydown}): x {x:.1f}; y {y:.1f}; z {z:.1f}"
+                lines.append(text)
+
+            self.draw_landmark_text(annotated_img, text_x, text_y, lines)
 
         return annotated_img
 
     # show coordinates of specified landmarks
-    def draw_finger(self, img):
-        annotated_img = np.copy(img)
+    def draw_finger(self, img, state=None):
+        if not self.hud.enabled:
+            return img
+        if state is None:
+            state = self.snapshot()
+
+        annotated_img = img  # annotated in place
 
         # extract which hand is right hand
-        hand_id = -1
-        for id, hand in enumerate(self.handedness_list):
-            if hand[0].category_name == "Right":
-                hand_id = id
+        detection = state.detection
+        right_hands = np.flatnonzero(
+            detection.handedness == HANDEDNESS_NAMES.index("Right")
+        )
 
-        if hand_id == -1:
+        if len(right_hands) == 0:
             return annotated_img
+        hand_id = right_hands[-1]
 
         # right hand index finger
         landmark_id_list = [5, 6, 7, 8]
         landmark_names = ["MCP", "DIP", "PIP", "TIP"]
         local_text_x, text_y = 20, 40
         world_text_x = 400
-        for idx, landmark_id in enumerate(landmark_id_list):
-            # parse landmark coordinates
-            landmark = self.hand_landmarks_list[hand_id][landmark_id]
-            x, y, z = landmark.x, landmark.y, landmark.z
-            text = f"{landmark_names[idx]}: x {x*100:.1f}; y {y*100:.1f}; z {z*100:.1f}"
 
-            cv2.putText(
-                annotated_img,
-                text,
-                (local_text_x, text_y),
-                cv2.FONT_HERSHEY_DUPLEX,
-                self.landmark_text_format["FONT_SIZE"],
-                self.landmark_text_format["TEXT_COLOR"],
-                self.landmark_text_format["FONT_THICKNESS"],
-                cv2.LINE_AA,
-            )
+        # parse landmark coordinates, as percentages
+        local = detection.landmarks[hand_id, landmark_id_list] * 100
+        world = detection.world_landmarks[hand_id, landmark_id_list] * 100
+        local_lines, world_lines = [], []
+        for idx in range(len(landmark_id_list)):
+            x, y, z = local[idx].tolist()
+            text = f"{landmark_names[idx]}: x {x:.1f}; y {y:.1f}; z {z:.1f}"
+            local_lines.append(text)
 
-            landmark = self.world_landmarks_list[hand_id][landmark_id]
-            x, y, z = landmark.x, landmark.y, landmark.z
-            text = f"{landmark_names[idx]}: x {x*100:.1f}; y {y*100:.1f}; z {z*100:.1f}"
-            cv2.putText(
-                annotated_img,
-                text,
-                (world_text_x, text_y),
-                cv2.FONT_HERSHEY_DUPLEX,
-                self.landmark_text_format["FONT_SIZE"],
-                self.landmark_text_format["TEXT_COLOR"],
-                self.landmark_text_format["FONT_THICKNESS"],
-                cv2.LINE_AA,
-            )
+            x, y, z = world[idx].tolist()
+            text = f"{landmark_names[idx]}: x {x:.1f}; y {y:.1f}; z {z:.1f}"
+            world_lines.append(text)
 
-            text_y += 15
+        self.draw_landmark_text(annotated_img, local_text_x, text_y, local_lines)
+        self.draw_landmark_text(annotated_img, world_text_x, text_y, world_lines)
 
         return annotated_img
 
-    def simple_hand_landmark_style(self) -> Mapping[Tuple[int, int], DrawingSpec]:
-        hand_landmark_style = {}
-        spec = DrawingSpec(color=BLUE, thickness=-1, circle_radius=5)
-
-        for landmark_id in range(21):
-            hand_landmark_style[landmark_id] = spec
+    # draw the skeleton of one hand from its (21, 3) normalized landmarks
+    # all connections go in one polylines call, and all circles of a color in
+    # another: a zero length segment of thickness 2r is a filled circle of radius r
+    def draw_skeleton(self, img, landmarks):
+        height, width = img.shape[:2]
+
+        # landmarks outside the frame are not drawn, nor their connections
+        xy = landmarks[:, :2]
+        visible = ((xy >= 0) & (xy <= 1)).all(axis=1)
+        if not visible.any():
+            return img
+        points = np.minimum(np.floor(xy * (width, height)), (width - 1, height - 1))
+        points = points.astype(np.int32)
+
+        connections = HAND_CONNECTIONS[visible[HAND_CONNECTIONS].all(axis=1)]
+        if len(connections):
+            cv2.polylines(
+                img,
+                points[connections],
+                False,
+                self.skeleton_format["CONNECTION_COLOR"],
+                self.skeleton_format["CONNECTION_THICKNESS"],
+            )
 
-        return hand_landmark_style
+        dots = np.repeat(points[visible, None], 2, axis=1)
+        cv2.polylines(
+            img,
+            dots,
+            False,
+            self.skeleton_format["BORDER_COLOR"],
+            2 * self.skeleton_format["BORDER_RADIUS"],
+        )
+        cv2.polylines(
+            img,
+            dots,
+            False,
+            self.skeleton_format["LANDMARK_COLOR"],
+            2 * self.skeleton_format["LANDMARK_RADIUS"],
+        )
 
-    def simple_hand_connection_style(self) -> Mapping[Tuple[int, int], DrawingSpec]:
-        hand_connection_style = {}
-        spec = DrawingSpec(color=WHITE, thickness=2)
+        return img
 
-        for conn in hands_connections.HAND_CONNECTIONS:
-            hand_connection_style[conn] = spec
+    def draw_landmarks_on_image(self, rgb_image, state=None):
+        if state is None:
+            state = self.snapshot()
 
-        return hand_connection_style
+        annotated_image = rgb_image  # annotated in place
 
-    def draw_landmarks_on_image(self, rgb_image):
-        annotated_image = np.copy(rgb_image)
+        detection = state.detection
 
         # Loop through the detected hands to visualize.
-        for idx in range(len(self.hand_landmarks_list)):
-            hand_landmarks = self.hand_landmarks_list[idx]
-            handedness = self.handedness_list[idx]
+        for idx in range(len(detection.handedness)):
+            hand_landmarks = detection.landmarks[idx]
+            handedness = HANDEDNESS_NAMES[detection.handedness[idx]]
 
             # Draw the hand landmarks.
-            hand_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-            hand_landmarks_proto.landmark.extend(
-                [
-                    landmark_pb2.NormalizedLandmark(
-                        x=landmark.x, y=landmark.y, z=landmark.z
-                    )
-                    for landmark in hand_landmarks
-                ]
-            )
-            solutions.drawing_utils.draw_landmarks(
-                annotated_image,
-                hand_landmarks_proto,
-                solutions.hands.HAND_CONNECTIONS,
-                self.simple_hand_landmark_style(),
-                self.simple_hand_connection_style(),
-            )
+            self.draw_skeleton(annotated_image, hand_landmarks)
 
             # Get the top left corner of the detected hand's bounding box.
             height, width, _ = annotated_image.shape
-            x_coordinates = [landmark.x for landmark in hand_landmarks]
-            y_coordinates = [landmark.y for landmark in hand_landmarks]
-            text_x = int(min(x_coordinates) * width)
-            text_y = int(min(y_coordinates) * height) - self.LR_text_format["MARGIN"]
+            min_x, min_y = hand_landmarks[:, :2].min(axis=0)
+            text_x = int(min_x * width)
+            text_y = int(min_y * height) - self.LR_text_format["MARGIN"]
 
             # Draw handedness (left or right hand) on the image.
             cv2.putText(
                 annotated_image,
-                f"{handedness[0].category_name}",
+                handedness,
                 (text_x, text_y),
                 cv2.FONT_HERSHEY_DUPLEX,
                 self.LR_text_format["FONT_SIZE"],
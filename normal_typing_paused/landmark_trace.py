@@ -0,0 +1,165 @@
+import argparse
+import time
+
+import numpy as np
+
+from hands import Hands
+from keyboard import Keyboard
+from landmarks import NUM_LANDMARKS, HandArrays
+from smoothing import FILTERS, make_smoother
+
+MAX_HANDS = 2
+
+
+class TraceRecorder:
+    # records landmarker results (landmarks.HandArrays) as float32 arrays
+    #   landmarks, world_landmarks: (frames, MAX_HANDS, 21, 3)
+    #   handedness: (frames, MAX_HANDS) landmarks.HANDEDNESS_NAMES index, -1 = none
+    #   handedness_score: (frames, MAX_HANDS)
+    #   timestamps: (frames,) milliseconds
+    def __init__(self):
+        self.landmarks = []
+        self.world_landmarks = []
+        self.handedness = []
+        self.handedness_score = []
+        self.timestamps = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def record(self, detection, timestamp):
+        landmarks = np.zeros((MAX_HANDS, NUM_LANDMARKS, 3), dtype=np.float32)
+        world_landmarks = np.zeros((MAX_HANDS, NUM_LANDMARKS, 3), dtype=np.float32)
+        handedness = np.full(MAX_HANDS, -1, dtype=np.int8)
+        handedness_score = np.zeros(MAX_HANDS, dtype=np.float32)
+
+        hands = min(len(detection.handedness), MAX_HANDS)
+        landmarks[:hands] = detection.landmarks[:hands]
+        world_landmarks[:hands] = detection.world_landmarks[:hands]
+        handedness[:hands] = detection.handedness[:hands]
+        handedness_score[:hands] = detection.handedness_score[:hands]
+
+        self.landmarks.append(landmarks)
+        self.world_landmarks.append(world_landmarks)
+        self.handedness.append(handedness)
+        self.handedness_score.append(handedness_score)
+        self.timestamps.append(timestamp)
+
+    def save(self, path):
+        landmarks_shape = (len(self), MAX_HANDS, NUM_LANDMARKS, 3)
+        hands_shape = (len(self), MAX_HANDS)
+        np.savez(
+            path,
+            landmarks=np.array(self.landmarks, np.float32).reshape(landmarks_shape),
+            world_landmarks=np.array(self.world_landmarks, np.float32).reshape(
+                landmarks_shape
+            ),
+            handedness=np.array(self.handedness, np.int8).reshape(hands_shape),
+            handedness_score=np.array(self.handedness_score, np.float32).reshape(
+                hands_shape
+            ),
+            timestamps=np.array(self.timestamps, dtype=np.int64),
+        )
+
+
+class TraceReplayer:
+    # plays back a recorded trace as (detection, timestamp) pairs
+    # the detections can be passed to Hands.process_results in place of real ones
+    def __init__(self, path):
+        with np.load(path) as trace:
+            self.landmarks = trace["landmarks"]
+            self.world_landmarks = trace["world_landmarks"]
+            self.handedness = trace["handedness"]
+            self.handedness_score = trace["handedness_score"]
+            self.timestamps = trace["timestamps"]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def result(self, frame):
+        hands = np.flatnonzero(self.handedness[frame] >= 0)
+        return HandArrays(
+            self.landmarks[frame, hands],
+            self.world_landmarks[frame, hands],
+            self.handedness[frame, hands],
+            self.handedness_score[frame, hands],
+        )
+
+    def __iter__(self):
+        for frame in range(len(self)):
+            yield self.result(frame), int(self.timestamps[frame])
+
+
+class KeyLog:
+    # key event sink of Hands (in place of events.KeyEventBus) that types each
+    # key into keyboard right away and remembers (frame, finger, key) of each
+    # keydown, so both variants report what their keydown logic did
+    def __init__(self, keyboard):
+        self.keyboard = keyboard
+        self.frame = 0  # frame being replayed, set by replay
+        self.keydowns = []
+
+    def publish(self, event):
+        self.keydowns.append((self.frame, event.finger, event.key))
+        self.keyboard.type_key(event.key)
+
+
+# feed a trace through Hands and Keyboard as fast as possible
+# smoother (smoothing.HandSmoother) filters the landmarks first, as in App
+# keydowns are (frame, finger, key), frames counted over all repeats
+def replay(path, repeat=1, smoother=None):
+    replayer = TraceReplayer(path)
+    results = list(replayer)
+
+    hands = Hands()
+    keyboard = Keyboard()
+    key_log = KeyLog(keyboard)
+    hands.key_events = key_log
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for result, timestamp in results:
+            if smoother is not None:
+                result = smoother(result, timestamp)
+            hands.process_results(result, timestamp, keyboard)
+            key_log.frame += 1
+    elapsed = time.perf_counter() - start
+
+    frames = len(results) * repeat
+    return {
+        "frames": frames,
+        "seconds": round(elapsed, 4),
+        "fps": round(frames / elapsed, 1) if elapsed > 0 else 0.0,
+        "keystrokes": hands.keystrokes,
+        "typed": "".join(key for _, _, key in key_log.keydowns),
+        "keydowns": key_log.keydowns,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a landmark trace through the typing logic"
+    )
+    parser.add_argument("trace", help=".npz trace recorded with App(record_path=...)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--smoothing", choices=sorted(FILTERS), help="filter landmarks before replay"
+    )
+    parser.add_argument(
+        "--keydowns",
+        action="store_true",
+        help="list every keydown as: frame finger key",
+    )
+    args = parser.parse_args()
+
+    smoother = make_smoother(args.smoothing) if args.smoothing else None
+    report = replay(args.trace, args.repeat, smoother)
+    keydowns = report.pop("keydowns")
+    if args.keydowns:
+        for frame, finger, key in keydowns:
+            print(frame, finger, key)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import numpy as np
+
+from landmarks import HANDEDNESS_NAMES, NUM_LANDMARKS, HandArrays
+
+# one filter slot per handedness, a hand keeps its slot while it stays on screen
+SLOT_SHAPE = (len(HANDEDNESS_NAMES), NUM_LANDMARKS, 3)
+MIN_DT = 1e-3  # seconds, guards against repeated timestamps
+
+
+class OneEuroFilter:
+    # One Euro filter (Casiez et al. 2012) on every coordinate at once
+    # low pass whose cutoff rises with speed: still hands are smoothed hard
+    # (less jitter), moving hands barely (less lag)
+    #   min_cutoff: cutoff in Hz at rest, lower = smoother
+    #   beta: cutoff increase per unit of speed, higher = less lag
+    #   d_cutoff: cutoff in Hz of the speed estimate
+    def __init__(self, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+
+        self.value = np.zeros(SLOT_SHAPE, dtype=np.float32)
+        self.speed = np.zeros(SLOT_SHAPE, dtype=np.float32)
+
+    # smoothing factor of a first order low pass for time step dt
+    def alpha(self, dt, cutoff):
+        tau = 1 / (2 * np.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+    # filter values (SLOT_SHAPE), dt: (slots, 1, 1) seconds since last sample
+    # slots in start begin again from their value
+    def __call__(self, values, dt, start):
+        speed = (values - self.value) / dt
+        speed += (1 - self.alpha(dt, self.d_cutoff)) * (self.speed - speed)
+        cutoff = self.min_cutoff + self.beta * np.abs(speed)
+        value = values + (1 - self.alpha(dt, cutoff)) * (self.value - values)
+
+        self.value[:] = np.where(start[:, None, None], values, value)
+        self.speed[:] = np.where(start[:, None, None], 0, speed)
+        return self.value
+
+
+class KalmanFilter:
+    # constant velocity Kalman filter on every coordinate at once
+    # coordinates are filtered independently with the same noise model, so the
+    # error covariance depends only on time steps and is kept once per slot
+    #   process_noise: acceleration noise density, higher = less lag
+    #   measurement_noise: variance of a landmark measurement, higher = smoother
+    def __init__(self, process_noise=0.1, measurement_noise=1e-5):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+        self.value = np.zeros(SLOT_SHAPE, dtype=np.float32)
+        self.speed = np.zeros(SLOT_SHAPE, dtype=np.float32)
+        # covariance [[p00, p01], [p01, p11]] of (value, speed) per slot
+        self.p00 = np.zeros((SLOT_SHAPE[0], 1, 1))
+        self.p01 = np.zeros((SLOT_SHAPE[0], 1, 1))
+        self.p11 = np.zeros((SLOT_SHAPE[0], 1, 1))
+
+    # filter values (SLOT_SHAPE), dt: (slots, 1, 1) seconds since last sample
+    # slots in start begin again from their value
+    def __call__(self, values, dt, start):
+        q = self.process_noise
+
+        # predict
+        value = self.value + self.speed * dt
+        p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + q * dt**3 / 3
+        p01 = self.p01 + dt * self.p11 + q * dt**2 / 2
+        p11 = self.p11 + q * dt
+
+        # update with the measurement
+        gain_value = p00 / (p00 + self.measurement_noise)
+        gain_speed = p01 / (p00 + self.measurement_noise)
+        residual = values - value
+        value += gain_value * residual
+        speed = self.speed + gain_speed * residual
+        p11 = p11 - gain_speed * p01
+        p01 = (1 - gain_value) * p01
+        p00 = (1 - gain_value) * p00
+
+        # restarted slots: value known up to measurement noise, speed unknown
+        restart = start[:, None, None]
+        self.value[:] = np.where(restart, values, value)
+        self.speed[:] = np.where(restart, 0, speed)
+        self.p00[:] = np.where(restart, self.measurement_noise, p00)
+        self.p01[:] = np.where(restart, 0, p01)
+        self.p11[:] = np.where(restart, q, p11)
+        return self.value
+
+
+FILTERS = {"one_euro": OneEuroFilter, "kalman": KalmanFilter}
+
+# starting points per coordinate system, tune by replaying a trace
+#   landmarks: fraction of frame size, world_landmarks: meters
+DEFAULT_PARAMS = {
+    "one_euro": (
+        {"min_cutoff": 1.0, "beta": 10.0},
+        {"min_cutoff": 1.0, "beta": 50.0},
+    ),
+    "kalman": (
+        {"process_noise": 0.1, "measurement_noise": 1e-5},
+        {"process_noise": 0.01, "measurement_noise": 1e-5},
+    ),
+}
+
+
+class HandSmoother:
+    # temporal filtering of landmarker results (landmarks.HandArrays)
+    # between the landmarker and Hands.process_results
+    # each hand is filtered in the slot of its handedness, a hand that (re)appears
+    # or a timestamp going backwards (e.g. replaying a trace again) restarts it
+    def __init__(self, landmark_filter, world_filter):
+        self.landmark_filter = landmark_filter
+        self.world_filter = world_filter
+
+        self.tracked = np.zeros(SLOT_SHAPE[0], dtype=bool)
+        self.last_timestamp = None
+
+        self.landmarks = np.zeros(SLOT_SHAPE, dtype=np.float32)
+        self.world_landmarks = np.zeros(SLOT_SHAPE, dtype=np.float32)
+
+    def reset(self):
+        self.tracked.fill(False)
+        self.last_timestamp = None
+
+    def __call__(self, detection, timestamp):
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            self.reset()
+        dt = MIN_DT
+        if self.last_timestamp is not None:
+            dt = max((timestamp - self.last_timestamp) / 1000, MIN_DT)
+        self.last_timestamp = timestamp
+
+        # a hand takes the slot of its handedness, if two hands claim the same
+        # slot the last one is filtered and the others pass through
+        hands = detection.handedness.astype(np.intp)
+        rows = np.arange(len(hands))
+        owner = np.full(SLOT_SHAPE[0], -1)
+        owner[hands] = rows
+        owned = owner[hands] == rows
+
+        present = owner >= 0
+        start = present & ~self.tracked
+        self.tracked[:] = present
+        if not present.any():
+            return detection
+
+        # absent slots are filtered too (the arrays are tiny), but never read
+        self.landmarks[hands] = detection.landmarks
+        self.world_landmarks[hands] = detection.world_landmarks
+        dts = np.full((SLOT_SHAPE[0], 1, 1), dt, dtype=np.float32)
+        landmarks = self.landmark_filter(self.landmarks, dts, start)
+        world_landmarks = self.world_filter(self.world_landmarks, dts, start)
+
+        # new arrays, detections are shared and never written to
+        smoothed_landmarks = detection.landmarks.copy()
+        smoothed_world_landmarks = detection.world_landmarks.copy()
+        smoothed_landmarks[owned] = landmarks[hands[owned]]
+        smoothed_world_landmarks[owned] = world_landmarks[hands[owned]]
+
+        return HandArrays(
+            smoothed_landmarks,
+            smoothed_world_landmarks,
+            detection.handedness,
+            detection.handedness_score,
+        )
+
+
+# smoother with a filter of the given kind (FILTERS) for both coordinate systems
+# landmark_params / world_params override DEFAULT_PARAMS
+def make_smoother(kind="one_euro", landmark_params=None, world_params=None):
+    default_landmark_params, default_world_params = DEFAULT_PARAMS[kind]
+    return HandSmoother(
+        FILTERS[kind](**{**default_landmark_params, **(landmark_params or {})}),
+        FILTERS[kind](**{**default_world_params, **(world_params or {})}),
+    )
+
+
+# scalar One Euro filter as published (Casiez et al. 2012), for checking
+# OneEuroFilter: filtered values of samples taken dt seconds apart
+def one_euro_reference(samples, dt, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+    def alpha(cutoff):
+        tau = 1 / (2 * np.pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+    value, speed = samples[0], 0.0
+    filtered = [value]
+    for sample in samples[1:]:
+        a_d = alpha(d_cutoff)
+        speed = a_d * (sample - value) / dt + (1 - a_d) * speed
+        a = alpha(min_cutoff + beta * abs(speed))
+        value = a * sample + (1 - a) * value
+        filtered.append(value)
+    return np.array(filtered)
+
+
+# compare OneEuroFilter on a noisy random walk with one_euro_reference
+def check_one_euro(frames=300, dt=1 / 30, min_cutoff=1.0, beta=10.0):
+    rng = np.random.default_rng(0)
+    walk = rng.normal(0, 0.01, (frames,) + SLOT_SHAPE).cumsum(axis=0)
+    samples = (0.5 + walk + rng.normal(0, 0.002, walk.shape)).astype(np.float32)
+
+    one_euro = OneEuroFilter(min_cutoff, beta)
+    dts = np.full((SLOT_SHAPE[0], 1, 1), dt, dtype=np.float32)
+    start = np.ones(SLOT_SHAPE[0], dtype=bool)
+    filtered = []
+    for frame in samples:
+        filtered.append(one_euro(frame, dts, start).copy())
+        start[:] = False
+
+    reference = one_euro_reference(samples.astype(np.float64), dt, min_cutoff, beta)
+    error = float(np.abs(np.array(filtered) - reference).max())
+    print(f"one euro max error vs reference: {error:.2e}")
+    return error < 1e-4
+
+
+if __name__ == "__main__":
+    print("ok" if check_one_euro() else "MISMATCH")